@@ -1 +1,4 @@
 from .simulatedannealing import simulated_annealing
+from .parallelchains import parallel_simulated_annealing
+from .paralleltempering import parallel_tempering
+from .checkpoint import Checkpointer, load_checkpoint, write_file_atomically
@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import tempfile
+
+
+# A checkpoint is a JSON file with the state of the search under "search" (see simulated_annealing()),
+# along with any data the caller needs to recreate the problem (e.g. the requests of the stations).
+
+# Load the checkpoint from the file.
+#
+# @return the checkpoint as a dictionary or None if the file does not exist
+def load_checkpoint(file_path):
+    if not os.path.exists(file_path):
+        return None
+
+    with open(file_path) as file:
+        return json.load(file)
+
+
+# Write a file atomically: the given function writes the contents to a temporary file in the same directory,
+# which then replaces the file, so that a reader (or a process stopped while writing) never sees a partially
+# written file. The temporary file is removed if the writing fails.
+#
+# @param write - function that writes the contents to the (open) file it is given
+# @param binary - whether the file is opened in the binary mode
+def write_file_atomically(file_path, write, binary = False):
+    file_descriptor, temp_path = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(file_path)), suffix = ".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb" if binary else "w") as temp_file:
+            write(temp_file)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+# Write the checkpoint to the file atomically, so that a search stopped while saving one
+# never leaves a partially written checkpoint behind.
+def save_checkpoint(file_path, checkpoint):
+    write_file_atomically(file_path, lambda file: json.dump(checkpoint, file, separators = (",", ":")))
+
+
+# The state of a random number generator (random.Random or the random module) in JSON types and back.
+def encode_rng_state(rng):
+    version, internal_state, gauss_next = rng.getstate()
+    return [ version, list(internal_state), gauss_next ]
+
+
+def decode_rng_state(state):
+    version, internal_state, gauss_next = state
+    return version, tuple(internal_state), gauss_next
+
+
+# Saves the state of a search to a checkpoint file at most once per interval (in seconds) and holds
+# the state the search is resumed from (None to start a new search). The data is saved with every checkpoint.
+class Checkpointer:
+    def __init__(self, file_path, interval = 60, resume_state = None, data = None):
+        self._file_path = file_path
+        self._interval = interval
+        self._resume_state = resume_state
+        self._data = data if data is not None else {}
+
+        self._save_time = time.monotonic()
+
+    @property
+    def file_path(self):
+        return self._file_path
+
+    @property
+    def resume_state(self):
+        return self._resume_state
+
+    # whether the interval has passed since the last checkpoint
+    def is_due(self):
+        return time.monotonic() - self._save_time >= self._interval
+
+    def save(self, search_state):
+        save_checkpoint(self._file_path, { **self._data, "search": search_state })
+        self._save_time = time.monotonic()
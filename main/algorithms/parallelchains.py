@@ -0,0 +1,86 @@
+import os
+import random
+import multiprocessing
+import numpy as np
+from .simulatedannealing import simulated_annealing
+
+
+# Compute the seed of each of the chains from the master seed.
+#
+# The master seed can be an int, a list of ints (e.g. [seed, group] for the chains of one group of stations)
+# or None for a random one. The chain seeds are spawned from it as a numpy SeedSequence, i.e. they are
+# independent of each other and always the same for the same master seed.
+#
+# @return list of ints, one seed per chain
+def compute_chain_seeds(master_seed, chains):
+    seed_sequence = np.random.SeedSequence(master_seed)
+
+    return [ int( child.generate_state(1, dtype = np.uint64)[0] ) for child in seed_sequence.spawn(chains) ]
+
+
+# Run a single chain of the simulated annealing with its own random number generator.
+# NOTE: the pool of parallel_simulated_annealing() sends the function to its worker processes by its qualified name,
+#       so it has to be defined at the module level (a nested function or a lambda cannot be pickled)
+#
+# @return a pair: (the best solution or None, the statistics of the chain, see compute_search_stats())
+def run_chain(problem, hyperparameters, chain_seed, time_limit = None, iteration_limit = None, on_improvement = None, improvement_interval = 0, checkpointer = None):
+    problem.rng = random.Random(chain_seed)
+
+    chain_stats = {}
+    solution = simulated_annealing(problem, hyperparameters, time_limit, iteration_limit, on_improvement, improvement_interval, chain_stats, checkpointer)
+
+    return solution, chain_stats
+
+
+# Run the given number of independent chains of the simulated annealing on the problem, each seeded
+# from the master seed (see compute_chain_seeds()), in a pool of processes (at most one per chain and
+# one per core if processes is None) and return the best solution found.
+#
+# Every chain computes its own initial solution and draws all its random numbers from its own generator,
+# so the result only depends on the master seed and not on the number of processes or the order in which
+# the chains finish (ties are resolved in favour of the chain with the lowest index).
+#
+# The budgets apply to every chain: the iteration limit as it is, the time limit is split so that all the
+# chains (which run processes at a time) finish within it. The remaining parameters are as in simulated_annealing(),
+# the stats are those of the best chain with the statistics of all the chains under "chains".
+# NOTE: on_improvement is called in the worker processes, i.e. it has to be picklable (see solver.incumbents)
+#
+# A single chain can be checkpointed (and resumed) by the given checkpointer, see simulated_annealing().
+#
+# @return the best solution of all the chains or None if none of them found a solution
+def parallel_simulated_annealing(problem, hyperparameters, chains = 1, master_seed = None, processes = None,
+        time_limit = None, iteration_limit = None, on_improvement = None, improvement_interval = 0, stats = None, checkpointer = None):
+    if checkpointer is not None and chains != 1:
+        raise ValueError("Only a single chain of the simulated annealing can be checkpointed (chains: " + str(chains) + ")")
+
+    # a single unseeded chain is the plain simulated annealing, using the random module
+    if chains == 1 and master_seed is None:
+        return simulated_annealing(problem, hyperparameters, time_limit, iteration_limit, on_improvement, improvement_interval, stats, checkpointer)
+
+    chain_seeds = compute_chain_seeds(master_seed, chains)
+
+    if processes is None:
+        processes = os.cpu_count()
+    processes = max(1, min(processes, chains))
+
+    chain_time_limit = time_limit * processes / chains if time_limit is not None else None
+    chain_arguments = [ (problem, hyperparameters, chain_seed, chain_time_limit, iteration_limit, on_improvement, improvement_interval, checkpointer) for chain_seed in chain_seeds ]
+
+    if processes <= 1:
+        results = [ run_chain(*arguments) for arguments in chain_arguments ]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(run_chain, chain_arguments)
+
+    best_solution = None
+    best_stats = {}
+    for solution, chain_stats in results:
+        if solution is not None and (best_solution is None or solution.cost < best_solution.cost):
+            best_solution = solution
+            best_stats = chain_stats
+
+    if stats is not None:
+        stats.update(best_stats)
+        stats["chains"] = [ chain_stats for solution, chain_stats in results ]
+
+    return best_solution
@@ -0,0 +1,321 @@
+import os
+import math
+import time
+import random
+import traceback
+import multiprocessing
+from .simulatedannealing import AnnealingChain, compute_initial_temp, compute_minimum_temp, compute_initial_cost_difference
+from .parallelchains import compute_chain_seeds
+
+
+# hyperparameters = {
+#     "initial_probability_threshold": 0.95,   # the hottest replica accepts all neighbours of an initial solution with at least this probability
+#     "min_temp_percentage": 0.005,   # the temperature of the coldest replica, as a percentage of the hottest one
+#     "replicas": 8,   # number of replicas, i.e. of temperatures on the (geometric) ladder
+#     "sweep_length": 50,   # number of steps of each replica between two rounds of exchanges
+#     "sweeps": 200,  # number of rounds of exchanges, i.e. the length of the search
+#     "initial_temp_mode": "bound"  # (optional) how the hottest temperature is computed, see simulatedannealing.INITIAL_TEMP_MODES
+# }
+
+
+# The geometric ladder of temperatures from max_temp (index 0) down to min_temp.
+def compute_temperature_ladder(max_temp, min_temp, replicas_num):
+    if replicas_num == 1:
+        return [ min_temp ]
+
+    ratio = (min_temp / max_temp) ** ( 1 / (replicas_num - 1) )
+
+    return [ max_temp * ratio ** index for index in range(0, replicas_num) ]
+
+
+# A replica of the parallel tempering: a chain of the search with its own random number generator.
+class Replica:
+    def __init__(self, problem, seed, hyperparameters):
+        self._problem = problem
+        self._rng = random.Random(seed)
+
+        self._problem.rng = self._rng
+        initial_config = problem.generate_solution()
+
+        self._chain = AnnealingChain(initial_config, self._rng) if initial_config is not None else None
+        self._max_cost_difference = compute_initial_cost_difference(initial_config, hyperparameters) if initial_config is not None else None
+
+    @property
+    def chain(self):
+        return self._chain
+
+    @property
+    def max_cost_difference(self):
+        return self._max_cost_difference
+
+    # perform the given number of steps at the temperature
+    # @return a pair: (the cost of the current solution, the cost of the best solution)
+    def run(self, temp, steps):
+        # the replicas hosted by one process share the problem, i.e. the generator it uses is switched
+        self._problem.rng = self._rng
+
+        for i in range(0, steps):
+            if not self._chain.step(temp):
+                break
+
+        return self._chain.current_cost, self._chain.best_cost
+
+    # the best solution with the number of steps performed and of neighbours accepted
+    def get_result(self):
+        return self._chain.best_config, self._chain.iterations, self._chain.accepted
+
+
+# Execute a command (other than the first reply) on the replicas, see host_replicas().
+def execute_command(replicas, command):
+    if command[0] == "run":
+        _, temperatures, steps = command
+        return { index: replicas[index].run(temp, steps) for index, temp in temperatures.items() }
+    elif command[0] == "incumbent":
+        return replicas[command[1]].chain.best_config
+    elif command[0] == "best":
+        return { index: replica.get_result() for index, replica in replicas.items() if replica.chain is not None }
+
+
+# The replicas hosted by one process, which executes the commands sent through the connection:
+#   ("run", { replica index: temperature }, steps) - perform the steps, reply with { replica index: (current cost, best cost) }
+#   ("incumbent", replica index)                   - reply with the best solution of the replica
+#   ("best",)                                      - reply with { replica index: (best solution, steps, accepted) } and stop
+# Once created, the replicas reply with { replica index: (current cost, max cost difference) or None },
+# where None means that the replica did not find an initial solution.
+# If the replicas raise an exception, the reply is ("error", traceback) and the process stops.
+def host_replicas(problem, seeds, hyperparameters, connection):
+    try:
+        replicas = { index: Replica(problem, seed, hyperparameters) for index, seed in seeds.items() }
+
+        connection.send({ index: (replica.chain.current_cost, replica.max_cost_difference) if replica.chain is not None else None for index, replica in replicas.items() })
+
+        while True:
+            command = connection.recv()
+            connection.send( execute_command(replicas, command) )
+
+            if command[0] == "best":
+                return
+    except Exception:
+        connection.send( ("error", traceback.format_exc()) )
+    finally:
+        connection.close()
+
+
+# Hosts the replicas in a worker process, see host_replicas().
+# The replies are received separately, so that all the processes can work at the same time.
+# The worker is a daemon process, so it never outlives the search, and it is terminated by close()
+# if the search stops on an error.
+class ProcessReplicaHost:
+    def __init__(self, problem, seeds, hyperparameters):
+        self._connection, worker_connection = multiprocessing.Pipe()
+
+        self._process = multiprocessing.Process(target = host_replicas, args = (problem, seeds, hyperparameters, worker_connection), daemon = True)
+        self._process.start()
+
+        # the parent keeps only its end of the pipe, so that it gets an EOFError (and not a hang) if the worker dies
+        worker_connection.close()
+
+    def send(self, command):
+        self._connection.send(command)
+
+    # @raise RuntimeError if the replicas of the worker raised an exception or the worker died
+    def receive(self):
+        try:
+            reply = self._connection.recv()
+        except EOFError:
+            raise RuntimeError("A replica host of the parallel tempering stopped without a reply (exit code: " + str(self._process.exitcode) + ")")
+
+        if isinstance(reply, tuple) and len(reply) == 2 and reply[0] == "error":
+            raise RuntimeError("A replica of the parallel tempering raised an exception:\n" + reply[1])
+
+        return reply
+
+    # receive the first reply (the replicas that were created)
+    def start(self):
+        return self.receive()
+
+    def close(self):
+        self._process.join()
+        self._connection.close()
+
+    # stop the worker if it is still running, e.g. after an error of the search
+    def terminate(self):
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._connection.close()
+
+
+# Hosts the replicas in the current process, with the same interface as ProcessReplicaHost.
+class LocalReplicaHost:
+    def __init__(self, problem, seeds, hyperparameters):
+        self._replicas = { index: Replica(problem, seed, hyperparameters) for index, seed in seeds.items() }
+        self._reply = None
+
+    def send(self, command):
+        self._reply = execute_command(self._replicas, command)
+
+    def receive(self):
+        return self._reply
+
+    def start(self):
+        return { index: (replica.chain.current_cost, replica.max_cost_difference) if replica.chain is not None else None for index, replica in self._replicas.items() }
+
+    def close(self):
+        pass
+
+    def terminate(self):
+        pass
+
+
+# Parallel tempering (replica exchange): the replicas search at a ladder of fixed temperatures, each in
+# sweeps of sweep_length steps, and after every sweep the replicas at neighbouring temperatures exchange
+# their solutions with the probability min(1, exp( (1/T_i - 1/T_j) * (cost_i - cost_j) )), i.e. the good
+# solutions move down to the cold temperatures while the hot replicas keep exploring. The pairs (0, 1),
+# (2, 3), ... and (1, 2), (3, 4), ... are tried in alternate rounds.
+#
+# The replicas are hosted by a number of persistent worker processes (at most one per replica and one per
+# core if processes is None) that keep their solutions for the whole search; an exchange swaps the temperatures
+# of the two replicas instead of sending the solutions between the processes, which is equivalent.
+#
+# Every replica (and the exchanges) draws its random numbers from its own generator seeded from the master
+# seed (see compute_chain_seeds()), so the result only depends on the master seed (unless the time limit stops it).
+#
+# The budgets are checked between the sweeps: the search stops after the sweep that reaches the time limit or
+# the iteration limit (the number of steps of each replica). The best solution is reported to on_improvement
+# when a sweep improves it, at most once per improvement_interval seconds, and the stats are as in simulated_annealing()
+# with the steps and the accepted neighbours summed over the replicas and the number of sweeps and exchanges.
+#
+# @return the best solution found by any of the replicas or None if none of them found an initial solution
+def parallel_tempering(problem, hyperparameters, master_seed = None, processes = None,
+        time_limit = None, iteration_limit = None, on_improvement = None, improvement_interval = 0, stats = None):
+    start_time = time.monotonic()
+    deadline = start_time + time_limit if time_limit is not None else None
+
+    replicas_num = hyperparameters.get("replicas")
+    seeds = compute_chain_seeds(master_seed, replicas_num + 1)
+    exchange_rng = random.Random( seeds.pop() )
+
+    if processes is None:
+        processes = os.cpu_count()
+    processes = max(1, min(processes, replicas_num))
+
+    # the replicas are distributed between the hosts in turn
+    host_seeds = [ { index: seeds[index] for index in range(host_index, replicas_num, processes) } for host_index in range(0, processes) ]
+    if processes == 1:
+        hosts = [ LocalReplicaHost(problem, host_seeds[0], hyperparameters) ]
+    else:
+        hosts = [ ProcessReplicaHost(problem, replica_seeds, hyperparameters) for replica_seeds in host_seeds ]
+
+    # the workers are stopped if the search raises an exception, e.g. a RuntimeError for the error of a replica
+    try:
+        # the replicas that found an initial solution, the others are left out of the search
+        initial_states = {}
+        host_of_replica = {}
+        for host in hosts:
+            for index, initial_state in host.start().items():
+                if initial_state is not None:
+                    initial_states[index] = initial_state
+                    host_of_replica[index] = host
+
+        # the number of steps of each replica, of sweeps and of accepted exchanges
+        steps = 0
+        sweeps = 0
+        exchanges = 0
+        reported_cost = None
+
+        replica_indices = sorted(initial_states)
+        if len(replica_indices) > 0:
+            # the temperatures are computed for the largest cost difference of the initial solutions
+            max_cost_difference = max( [ max_cost_difference for cost, max_cost_difference in initial_states.values() ] )
+            max_temp = compute_initial_temp(max_cost_difference, hyperparameters.get("initial_probability_threshold"))
+            min_temp = compute_minimum_temp(max_temp, hyperparameters.get("min_temp_percentage"))
+            temperatures = compute_temperature_ladder(max_temp, min_temp, len(replica_indices))
+
+            # the replica at each temperature of the ladder
+            replica_at_temp = replica_indices.copy()
+            costs = { index: cost for index, (cost, max_cost_difference) in initial_states.items() }
+            initial_cost = min(costs.values())
+
+            # the best cost of any replica (and the replica that found it) and the one that was reported to on_improvement
+            best_cost = initial_cost
+            incumbent_replica = min(replica_indices, key = lambda index: costs[index])
+            report_time = start_time - improvement_interval
+
+            sweep_length = hyperparameters.get("sweep_length")
+            stop_reason = "schedule"
+            for sweep in range(0, hyperparameters.get("sweeps")):
+                if iteration_limit is not None and steps >= iteration_limit:
+                    stop_reason = "iteration_limit"
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    stop_reason = "time_limit"
+                    break
+
+                sweep_steps = sweep_length if iteration_limit is None else min(sweep_length, iteration_limit - steps)
+                steps += sweep_steps
+                sweeps += 1
+
+                for host in hosts:
+                    host_temperatures = { index: temperatures[temp_index] for temp_index, index in enumerate(replica_at_temp) if host_of_replica[index] is host }
+                    host.send( ("run", host_temperatures, sweep_steps) )
+
+                for host in hosts:
+                    for index, (cost, replica_best_cost) in host.receive().items():
+                        costs[index] = cost
+                        if replica_best_cost < best_cost:
+                            best_cost = replica_best_cost
+                            incumbent_replica = index
+
+                if on_improvement is not None and best_cost != reported_cost and time.monotonic() - report_time >= improvement_interval:
+                    host_of_replica[incumbent_replica].send( ("incumbent", incumbent_replica) )
+                    on_improvement(host_of_replica[incumbent_replica].receive(), best_cost)
+                    reported_cost = best_cost
+                    report_time = time.monotonic()
+
+                # try to exchange the solutions at neighbouring temperatures
+                for temp_index in range(sweep % 2, len(temperatures) - 1, 2):
+                    replica_1 = replica_at_temp[temp_index]
+                    replica_2 = replica_at_temp[temp_index + 1]
+
+                    exponent = (1 / temperatures[temp_index] - 1 / temperatures[temp_index + 1]) * (costs[replica_1] - costs[replica_2])
+                    if exponent >= 0 or math.exp(exponent) >= exchange_rng.random():
+                        replica_at_temp[temp_index] = replica_2
+                        replica_at_temp[temp_index + 1] = replica_1
+                        exchanges += 1
+
+        # collect the best solutions of the replicas
+        results = {}
+        for host in hosts:
+            host.send( ("best",) )
+        for host in hosts:
+            results.update( host.receive() )
+            host.close()
+    finally:
+        for host in hosts:
+            host.terminate()
+
+    best_config = None
+    for index in sorted(results):
+        if best_config is None or results[index][0].cost < best_config.cost:
+            best_config = results[index][0]
+
+    if on_improvement is not None and best_config is not None and best_config.cost != reported_cost:
+        on_improvement(best_config, best_config.cost)
+
+    if stats is not None:
+        if best_config is None:
+            stats.update({ "stop_reason": "no_initial_solution", "elapsed_time": time.monotonic() - start_time })
+        else:
+            stats.update({
+                "iterations": sum( [ iterations for config, iterations, accepted in results.values() ] ),
+                "accepted": sum( [ accepted for config, iterations, accepted in results.values() ] ),
+                "initial_cost": float(initial_cost),
+                "best_cost": float(best_config.cost),
+                "elapsed_time": time.monotonic() - start_time,
+                "stop_reason": stop_reason,
+                "sweeps": sweeps,
+                "exchanges": exchanges
+            })
+
+    return best_config
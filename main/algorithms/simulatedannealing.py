@@ -1,5 +1,6 @@
 import math
-import random
+import time
+from .checkpoint import encode_rng_state, decode_rng_state
 
 
 # hyperparameters = {
@@ -7,8 +8,31 @@ import random
 #     "alpha": 0.95,   # rate of change for temperature, should be within range (0.8, 0.99)
 #     "beta": 1.05,    # rate of change for phase length, should be > 1
 #     "min_temp_percentage": 0.005,   # used to determine the termination criterion, what percentage of the initial temperature is the minimum temperature
-#     "initial_phase_length": 10
+#     "initial_phase_length": 10,
+#     "stagnation_phases": None,    # (optional) stop when the best cost has not improved for this many phases
+#     "stagnation_acceptance": 1,   # (optional) only the phases with at most this acceptance rate count as not improving
+#     "initial_temp_mode": "bound", # (optional) one of INITIAL_TEMP_MODES
+#     "initial_temp_samples": 100   # (optional) number of neighbours sampled by the "sampled" initial temperature mode
 # }
+#
+# The schedule above is the geometric one: the temperature is multiplied by alpha and the phase length by beta
+# after every phase. With "schedule": "adaptive" the phases have a fixed length, sized from the number of
+# neighbours of the initial solution, and the temperature is multiplied by an alpha chosen from the acceptance
+# rate of the phase: the more neighbours were accepted, the faster the cooling, see compute_adaptive_alpha().
+# The hyperparameters that are not given are taken from adaptive_schedule_defaults; the minimum temperature is set
+# far lower than for the geometric schedule, as the search is expected to stop on stagnation once it has cooled down.
+SCHEDULES = ("geometric", "adaptive")
+
+adaptive_schedule_defaults = {
+    "phase_length_factor": 0.5,     # the phase length as a fraction of the size of the neighbourhood
+    "min_phase_length": 10,
+    "max_phase_length": 2000,
+    "min_alpha": 0.8,   # alpha after a phase in which all neighbours were accepted
+    "max_alpha": 0.99,  # alpha after a phase in which no neighbour was accepted
+    "min_temp_percentage": 0.000001,
+    "stagnation_phases": 10,
+    "stagnation_acceptance": 0.1
+}
 
 
 # Compute the initial temperature such that the probability for accepting all neighbours
@@ -24,6 +48,42 @@ def compute_initial_temp(max_cost_difference, initial_probability_threshold):
     return -1 * max_cost_difference / math.log( initial_probability_threshold )
 
 
+# The ways of computing the cost difference from which the initial temperature is computed:
+#   bound   - the bound on the difference between the cost of the solution and of any of its neighbours,
+#             see get_max_cost_difference() of the solutions
+#   sampled - the mean increase of the cost over a sample of the neighbours of the solution that are worse than it,
+#             i.e. the typical uphill move rather than a bound on the worst one, which is usually far larger
+INITIAL_TEMP_MODES = ("bound", "sampled")
+
+
+# Compute the cost difference for the initial temperature of the search from the solution, see INITIAL_TEMP_MODES.
+# NOTE: the sampled neighbours are drawn with the random number generator of the problem of the solution
+def compute_initial_cost_difference(config, hyperparameters):
+    mode = hyperparameters.get("initial_temp_mode", "bound")
+    if mode not in INITIAL_TEMP_MODES:
+        raise ValueError("Unknown initial temperature mode: " + str(mode) + " (available: " + ", ".join(INITIAL_TEMP_MODES) + ")")
+
+    if mode == "sampled":
+        in_place = hasattr(config, "propose_move")
+
+        cost_increases = []
+        for i in range(0, hyperparameters.get("initial_temp_samples", 100)):
+            neighbour = config.propose_move() if in_place else config.generate_neighbour()
+            if neighbour is None:
+                break
+
+            # a move is a tuple starting with the cost after the move, see AnnealingChain
+            new_cost = neighbour[0] if in_place else neighbour.cost
+            if new_cost > config.cost:
+                cost_increases.append(new_cost - config.cost)
+
+        # the bound is used if no worse neighbour was found
+        if len(cost_increases) > 0:
+            return sum(cost_increases) / len(cost_increases)
+
+    return config.get_max_cost_difference()
+
+
 def compute_minimum_temp(temp, min_temp_percentage):
     return min_temp_percentage * temp
 
@@ -36,43 +96,294 @@ def update_phase_length(phase_length, beta):
     return math.ceil( beta * phase_length )
 
 
+# The phase length of the adaptive schedule for the given size of the neighbourhood.
+def compute_adaptive_phase_length(neighbourhood_size, phase_length_factor, min_phase_length, max_phase_length):
+    return min( max( math.ceil(phase_length_factor * neighbourhood_size), min_phase_length ), max_phase_length )
+
+
+# The rate of change for temperature of the adaptive schedule, which goes linearly from max_alpha for
+# a phase in which no neighbour was accepted (the search is close to a local minimum, cool slowly) down to
+# min_alpha for a phase in which all of them were (the search is a random walk, cool fast).
+def compute_adaptive_alpha(acceptance_rate, min_alpha, max_alpha):
+    return max_alpha - (max_alpha - min_alpha) * acceptance_rate
+
+
 # def compute_initial_phase_length():
 #     pass
 
 
-def simulated_annealing(problem, hyperparameters):
-    # compute the initial solution/configuration
-    current_config = problem.generate_solution()
-    if current_config is None:
-        return None
+# A chain of the search, i.e. the current and the best solution, moved by steps at a given temperature.
+# Used by simulated_annealing() and by the parallel tempering.
+#
+# Solutions that can be changed in place (i.e. implement propose_move(), apply_move() and snapshot(),
+# see SBRP_Solution) are searched without creating a new solution for each neighbour; the best solution
+# is only copied when the search moves away from it to a worse one.
+class AnnealingChain:
+    def __init__(self, initial_config, rng):
+        self._current_config = initial_config
+        self._best_config = initial_config
+        self._best_cost = initial_config.cost
+
+        self._rng = rng
+        self._in_place = hasattr(initial_config, "propose_move")
+
+        self._iterations = 0
+        self._accepted = 0
+        self._best_is_current = True    # for the in-place search: whether the best solution is the current one (and has not been copied)
+
+    @property
+    def current_config(self):
+        return self._current_config
+
+    @property
+    def current_cost(self):
+        return self._current_config.cost
+
+    @property
+    def best_cost(self):
+        return self._best_cost
+
+    # the number of steps performed and of neighbours accepted
+    @property
+    def iterations(self):
+        return self._iterations
+
+    @property
+    def accepted(self):
+        return self._accepted
 
-    best_config = current_config
+    # NOTE: for the in-place search the best solution can be the current one, which changes with the next steps
+    @property
+    def best_config(self):
+        if self._in_place and self._best_is_current:
+            return self._current_config
 
-    phase_length = hyperparameters.get("initial_phase_length")
-    temp = compute_initial_temp(current_config.get_max_cost_difference(), hyperparameters.get("initial_probability_threshold"))
-    min_temp = compute_minimum_temp(temp, hyperparameters.get("min_temp_percentage"))
+        return self._best_config
 
-    finished = False
-    while not finished:
-        for i in range(phase_length):
+    # Perform one step of the search at the given temperature.
+    #
+    # @return False if the current solution has no neighbours (the chain cannot move), otherwise: True
+    def step(self, temp):
+        current_config = self._current_config
+        in_place = self._in_place
+
+        if in_place:
+            new_config = current_config.propose_move()
+        else:
             new_config = current_config.generate_neighbour()
-            if new_config is None:
+
+        if new_config is None:
+            return False
+
+        self._iterations += 1
+
+        # the new cost, a move is a tuple starting with the cost after the move
+        new_cost = new_config[0] if in_place else new_config.cost
+
+        # accept the new configuration if it is better (remember, lower cost is better),
+        # otherwise (if new config is worse than current config) accept with certain probability
+        if new_cost < current_config.cost or math.exp( (current_config.cost - new_cost) / temp ) >= self._rng.random():
+            self._accepted += 1
+
+            if not in_place:
+                # move to this solution
+                self._current_config = new_config
+                if new_cost < self._best_cost:    # if also the best config yet, update the best
+                    self._best_config = new_config
+                    self._best_cost = new_cost
+            else:
+                if new_cost < self._best_cost:
+                    self._best_is_current = True
+                    self._best_cost = new_cost
+                elif self._best_is_current:
+                    # moving away from the best solution, keep a copy of it
+                    self._best_config = current_config.snapshot()
+                    self._best_is_current = False
+
+                current_config.apply_move(new_config)
+
+        return True
+
+    # The state of the chain in JSON types, see restore(); the best solution is left out if it is the current one.
+    def get_state(self):
+        best_config = self.best_config
+
+        return {
+            "current_config": self._current_config.get_state(),
+            "best_config": best_config.get_state() if best_config is not self._current_config else None,
+            "iterations": self._iterations,
+            "accepted": self._accepted
+        }
+
+    # Recreate the chain on the problem from its state, see get_state().
+    @staticmethod
+    def restore(problem, state, rng):
+        chain = AnnealingChain(problem.restore_solution(state.get("current_config")), rng)
+
+        if state.get("best_config") is not None:
+            chain._best_config = problem.restore_solution(state.get("best_config"))
+            chain._best_cost = chain._best_config.cost
+            chain._best_is_current = False
+
+        chain._iterations = state.get("iterations")
+        chain._accepted = state.get("accepted")
+
+        return chain
+
+
+# Run the simulated annealing on the problem until the temperature drops below the minimum, the best cost stops
+# improving (see stagnation_phases) or the budget runs out.
+#
+# @param time_limit - the maximum time (in seconds) of the search, None for no limit
+# @param iteration_limit - the maximum number of steps of the search, None for no limit
+# @param on_improvement - called as on_improvement(best solution, best cost) when a better solution is found,
+#                         at most once per improvement_interval seconds (the last best solution is always reported);
+#                         NOTE: a solution changed in place (see AnnealingChain) has to be used before the call returns
+# @param stats - a dictionary, if given it is filled with the statistics of the search, see compute_search_stats()
+# @param checkpointer - if given, the state of the search is saved by it periodically (and when the budget runs out),
+#                       and the search is resumed from its resume state if it has one, see checkpoint.Checkpointer;
+#                       the resumed search continues exactly as the saved one would have (the iterations count towards
+#                       the iteration limit, the time limit applies to the resumed search only)
+#
+# @return the best solution found or None if no initial solution was found
+def simulated_annealing(problem, hyperparameters, time_limit = None, iteration_limit = None, on_improvement = None, improvement_interval = 0, stats = None, checkpointer = None):
+    start_time = time.monotonic()
+    deadline = start_time + time_limit if time_limit is not None else None
+
+    schedule = hyperparameters.get("schedule", "geometric")
+    if schedule not in SCHEDULES:
+        raise ValueError("Unknown schedule: " + str(schedule) + " (available: " + ", ".join(SCHEDULES) + ")")
+    if schedule == "adaptive":
+        hyperparameters = { **adaptive_schedule_defaults, **hyperparameters }
+
+    resume_state = checkpointer.resume_state if checkpointer is not None else None
+    if resume_state is None:
+        # compute the initial solution/configuration
+        current_config = problem.generate_solution()
+        if current_config is None:
+            if stats is not None:
+                stats.update({ "stop_reason": "no_initial_solution", "elapsed_time": time.monotonic() - start_time })
+            return None
+
+        # the random numbers are drawn from the generator of the problem, see Problem.rng
+        chain = AnnealingChain(current_config, problem.rng)
+        initial_cost = chain.best_cost
+
+        if schedule == "adaptive":
+            phase_length = compute_adaptive_phase_length(current_config.neighbourhood_size, hyperparameters.get("phase_length_factor"),
+                hyperparameters.get("min_phase_length"), hyperparameters.get("max_phase_length"))
+        else:
+            phase_length = hyperparameters.get("initial_phase_length")
+        temp = compute_initial_temp(compute_initial_cost_difference(current_config, hyperparameters), hyperparameters.get("initial_probability_threshold"))
+        min_temp = compute_minimum_temp(temp, hyperparameters.get("min_temp_percentage"))
+        position = 0    # the number of steps performed in the current phase
+
+        # the number of steps and of accepted neighbours and the best cost at the start of the current phase,
+        # and the number of phases (up to the current one) that did not improve the best cost
+        phase_start = [ chain.iterations, chain.accepted, chain.best_cost ]
+        stagnant_phases = 0
+    else:
+        problem.rng.setstate( decode_rng_state(resume_state.get("rng")) )
+        chain = AnnealingChain.restore(problem, resume_state.get("chain"), problem.rng)
+        initial_cost = resume_state.get("initial_cost")
+
+        phase_length = resume_state.get("phase_length")
+        temp = resume_state.get("temp")
+        min_temp = resume_state.get("min_temp")
+        position = resume_state.get("position")
+
+        phase_start = resume_state.get("phase_start")
+        stagnant_phases = resume_state.get("stagnant_phases")
+
+    # the best cost that was reported to on_improvement and when
+    reported_cost = None
+    report_time = start_time - improvement_interval
+
+    # the state from which the search continues with the step at the given position of the current phase
+    # NOTE: it has to be taken before the step draws any random numbers
+    def get_search_state(position):
+        return {
+            "chain": chain.get_state(),
+            "initial_cost": float(initial_cost),
+            "phase_length": phase_length,
+            "temp": float(temp),
+            "min_temp": float(min_temp),
+            "position": position,
+            "phase_start": [ phase_start[0], phase_start[1], float(phase_start[2]) ],
+            "stagnant_phases": stagnant_phases,
+            "rng": encode_rng_state(problem.rng)
+        }
+
+    stop_reason = None
+    while stop_reason is None:
+        for i in range(position, phase_length):
+            if checkpointer is not None and checkpointer.is_due():
+                checkpointer.save( get_search_state(i) )
+
+            if iteration_limit is not None and chain.iterations >= iteration_limit:
+                stop_reason = "iteration_limit"
+            elif deadline is not None and time.monotonic() >= deadline:
+                stop_reason = "time_limit"
+            elif not chain.step(temp):
                 print("Could not find a neighbour")
-                return best_config
+                stop_reason = "no_neighbour"
+
+            if stop_reason is not None:
+                # a search stopped by the budget can be resumed later
+                if checkpointer is not None and stop_reason in ("time_limit", "iteration_limit"):
+                    checkpointer.save( get_search_state(i) )
+                break
+
+            if on_improvement is not None and chain.best_cost != reported_cost and time.monotonic() - report_time >= improvement_interval:
+                on_improvement(chain.best_config, chain.best_cost)
+                reported_cost = chain.best_cost
+                report_time = time.monotonic()
+
+        position = 0
+        if stop_reason is None:
+            phase_iterations = chain.iterations - phase_start[0]
+            acceptance_rate = (chain.accepted - phase_start[1]) / phase_iterations if phase_iterations > 0 else 0
+            # while most neighbours are accepted the search is a random walk that is not expected to improve the best cost
+            is_stagnant = chain.best_cost >= phase_start[2] and acceptance_rate <= hyperparameters.get("stagnation_acceptance", 1)
+            stagnant_phases = stagnant_phases + 1 if is_stagnant else 0
+
+            if schedule == "adaptive":
+                temp = update_temp(temp, compute_adaptive_alpha(acceptance_rate, hyperparameters.get("min_alpha"), hyperparameters.get("max_alpha")))
+            else:
+                phase_length = update_phase_length(phase_length, hyperparameters.get("beta"))
+                temp = update_temp(temp, hyperparameters.get("alpha"))
+
+            if temp < min_temp:  # stopping criterion for the search
+                stop_reason = "schedule"
+            elif hyperparameters.get("stagnation_phases") is not None and stagnant_phases >= hyperparameters.get("stagnation_phases"):
+                stop_reason = "stagnation"
+
+            phase_start = [ chain.iterations, chain.accepted, chain.best_cost ]
+
+    if on_improvement is not None and chain.best_cost != reported_cost:
+        on_improvement(chain.best_config, chain.best_cost)
 
-            if new_config.cost < current_config.cost: # remember, lower cost is better
-                # accept the new configuration, i.e. move to this solution
-                current_config = new_config
-                if new_config.cost < best_config.cost:    # if also the best config yet, update the best
-                    best_config = new_config
-            # else (if new config is worse than current config), accept with certain probability
-            elif math.exp( (current_config.cost - new_config.cost) / temp ) >= random.random():
-                current_config = new_config
+    if stats is not None:
+        stats.update( compute_search_stats(chain, initial_cost, start_time, stop_reason) )
+        stats["final_temp"] = float(temp)
 
-        phase_length = update_phase_length(phase_length, hyperparameters.get("beta"))
-        temp = update_temp(temp, hyperparameters.get("alpha"))
+    return chain.best_config
 
-        if temp < min_temp:  # stopping criterion for the search
-            finished = True
 
-    return best_config
+# The statistics of a finished search:
+#   iterations   - the number of steps, i.e. of neighbours evaluated
+#   accepted     - the number of neighbours that were accepted
+#   initial_cost - the cost of the initial solution
+#   best_cost    - the cost of the best solution
+#   elapsed_time - the time of the search in seconds (including the initial solution)
+#   stop_reason  - why the search stopped: "schedule" (minimum temperature reached), "stagnation" (see stagnation_phases),
+#                  "time_limit", "iteration_limit", "no_neighbour" or "no_initial_solution"
+def compute_search_stats(chain, initial_cost, start_time, stop_reason):
+    return {
+        "iterations": chain.iterations,
+        "accepted": chain.accepted,
+        "initial_cost": float(initial_cost),
+        "best_cost": float(chain.best_cost),
+        "elapsed_time": time.monotonic() - start_time,
+        "stop_reason": stop_reason
+    }
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3.7
+
+import sys
+import os
+import time
+import random
+import multiprocessing
+
+import utils
+from solver.requests import compute_requests
+from solver.distance_cache import get_distance_matrix
+from solver.grouping import compute_station_groups
+from problem import SBRP
+from problem.utils import CONSTRUCTIONS
+
+import pandas as pd
+
+# the time (in seconds) after which a construction is terminated, e.g. if the exhaustive search does not finish
+CONSTRUCTION_TIME_LIMIT = 60
+# the seed of the requests, the grouping and the constructions, so that all of them start from the same problems
+SEED = 0
+# the compared ways of generating the initial solution of the whole problem, as pairs: (initial solution, construction),
+# see INITIAL_SOLUTIONS in problem/SBRP.py; with the savings, the construction is only used by the groups of the algorithm 2 (or if they fail)
+STRATEGIES = [ ("assignment", construction) for construction in CONSTRUCTIONS ] + [ ("savings", "nearest") ]
+
+# #######################################################################
+# Compare the ways of generating the initial solution (see STRATEGIES) on a set of problems: the cost of
+# the initial solution and the time it takes, both for the whole problem (algorithm 1) and for the groups
+# of stations of the algorithm 2 (with the construction of the paths only).
+#
+# usage: construction_benchmark.py <problem_dir> <stats_file> [distance_cache_dir]
+#
+def parse_args(argv):
+
+    if len(argv) < 3:
+        print("Incorrect number of parameters")
+        return None
+
+    args = {
+        "problem_dir": argv[1],
+        "stats_file": argv[2]
+    }
+
+    if len(argv) >= 4:
+        args["distance_cache_dir"] = argv[3]
+
+    return args
+
+# Construct the initial solution of the whole problem and the initial paths of the groups of stations.
+#
+# @return list: [SBRP cost, SBRP time, OnePDTSP cost, OnePDTSP time], where the OnePDTSP cost is the sum over the groups
+#         and the cost is None if the construction failed
+def construct_initial_solutions(distance_matrix, coordinates, requests, vehicle_num, vehicle_capacity, initial_solution, construction):
+    sbrp = SBRP(distance_matrix, requests, vehicle_num, vehicle_capacity, construction = construction, initial_solution = initial_solution)
+
+    # the whole problem, including the tabu search that groups the stations
+    sbrp.rng = random.Random(SEED)
+    start_time = time.time()
+    solution = sbrp.generate_solution()
+    SBRP_time = time.time() - start_time
+    SBRP_cost = solution.cost if solution is not None else None
+
+    # the (balanced) groups of the algorithm 2, the grouping itself is not timed
+    group_assignments, num_groups = compute_station_groups(coordinates[1:], distance_matrix[1:, 1:], requests, vehicle_num, vehicle_capacity, SEED, "balanced", 1)
+    OnePDTSP_cost = None
+    OnePDTSP_time = None
+    if group_assignments is not None:
+        groups = [ [0] for g in range(0, num_groups) ]
+        for station, group in enumerate(group_assignments):
+            groups[group].append(station + 1)
+
+        OnePDTSP_cost = 0
+        start_time = time.time()
+        for group in groups:
+            group_solution = sbrp.get_group_problem(group).generate_solution()
+            if group_solution is None:
+                OnePDTSP_cost = None
+                break
+            OnePDTSP_cost += group_solution.cost
+        OnePDTSP_time = time.time() - start_time
+
+    return [SBRP_cost, SBRP_time, OnePDTSP_cost, OnePDTSP_time]
+
+def run_construction(distance_matrix, coordinates, requests, vehicle_num, vehicle_capacity, initial_solution, construction, result):
+    result["result"] = construct_initial_solutions(distance_matrix, coordinates, requests, vehicle_num, vehicle_capacity, initial_solution, construction)
+
+def test_single_construction(distance_matrix, coordinates, requests, vehicle_num, vehicle_capacity, initial_solution, construction):
+    print("  " + initial_solution + "/" + construction, end = " ")
+    manager = multiprocessing.Manager()
+    result = manager.dict()
+
+    p = multiprocessing.Process(target = run_construction, args = (distance_matrix, coordinates, requests, vehicle_num, vehicle_capacity, initial_solution, construction, result))
+    p.start()
+    p.join(CONSTRUCTION_TIME_LIMIT)
+
+    # terminate the construction if it is still running
+    timed_out = p.is_alive()
+    if timed_out:
+        p.terminate()
+        p.join()
+        print("- timed out")
+        return [None, None, None, None, True, False]
+
+    # the construction raised an exception (printed by the child process) or the process was killed
+    row = result.get("result")
+    if row is None:
+        print("- failed (exit code: " + str(p.exitcode) + ")")
+        return [None, None, None, None, False, True]
+
+    print("- SBRP: " + str(row[0]) + ", OnePDTSP: " + str(row[2]))
+
+    return [ round(value, 3) if value is not None else None for value in row ] + [False, False]
+
+def test_single_problem(problem_dir, filename, options):
+    problem_specs = utils.load_problem_specs(problem_dir + filename)
+    if problem_specs is None or not utils.is_valid(problem_specs):
+        return []
+
+    id_mapping, coordinates, utilisation_data = utils.perform_preprocessing(problem_specs)
+    vehicle_num = problem_specs.get("vehicles").get("number")
+    vehicle_capacity = problem_specs.get("vehicles").get("capacity")
+
+    requests = compute_requests(utilisation_data, vehicle_capacity, "simulation", None, random.Random(SEED))
+    distance_matrix = get_distance_matrix(coordinates, "geodesic", options.get("distance_cache_dir"))
+
+    problem_name = filename[:len(filename) - 5]
+    stations_num = len(coordinates) - 1
+
+    rows = []
+    for initial_solution, construction in STRATEGIES:
+        stats = test_single_construction(distance_matrix, coordinates, requests, vehicle_num, vehicle_capacity, initial_solution, construction)
+        rows.append([problem_name, stations_num, vehicle_num, vehicle_capacity, initial_solution, construction] + stats)
+
+    return rows
+
+# The mean cost and time of each construction over the problems that every construction (see STRATEGIES) solved
+# within the time limit, so that the constructions are compared on the same problems.
+#
+# @return DataFrame with the mean cost and time of each construction and the number of problems they are taken over
+def compute_summary(stats_df, cost_column, time_column):
+    solved_df = stats_df[ (stats_df["timed_out"] == False) & stats_df[cost_column].notna() ]
+    solved_num = solved_df.groupby("problem_name").size()
+    common_problems = solved_num[ solved_num == len(STRATEGIES) ].index
+
+    common_df = solved_df[ solved_df["problem_name"].isin(common_problems) ].astype({ cost_column: float, time_column: float })
+    summary_df = common_df.groupby(["initial_solution", "construction"])[[cost_column, time_column]].mean()
+    summary_df["problems"] = len(common_problems)
+
+    return summary_df
+
+def main():
+    args = parse_args(sys.argv)
+    if args is None:
+        return
+
+    stats_df = pd.DataFrame(columns=["problem_name", "stations_num", "vehicle_num", "vehicle_capacity", "initial_solution", "construction",
+    "SBRP_cost", "SBRP_time", "OnePDTSP_cost", "OnePDTSP_time", "timed_out", "failed"])
+
+    problem_dir = args.get("problem_dir") + "/"
+    problem_files = sorted(os.listdir(problem_dir))
+
+    for filename in problem_files:
+        print("Testing: " + filename)
+        for problem_row in test_single_problem(problem_dir, filename, args):
+            stats_df.loc[len(stats_df)] = problem_row
+        print("--------------------------")
+
+    # summary: the mean of each construction over the problems that every construction solved
+    print( compute_summary(stats_df, "SBRP_cost", "SBRP_time").to_string() )
+    print( compute_summary(stats_df, "OnePDTSP_cost", "OnePDTSP_time").to_string() )
+    print( stats_df.groupby(["initial_solution", "construction"])[["timed_out", "failed"]].sum() )
+
+    # replace all the None values with "-"
+    stats_df = stats_df.fillna("-")
+
+    stats_df.to_csv(args.get("stats_file"))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,11 @@ import solver
 
 import pandas as pd
 
+# the time (in seconds) after which the search returns the best solution it has found so far
+TIME_LIMIT = 300
+# the extra time after which the process is terminated, e.g. if the initial solution cannot be found
+TIME_LIMIT_GRACE = 60
+
 # #######################################################################
 # The function parses command line parameters. It expects to receive an array
 # where each item is a parameter. The 0-th item is the name of the program followed
@@ -33,6 +38,14 @@ def parse_args(argv):
         "stats_file": argv[4]
     }
 
+    # the distance matrix cache is optional, it is shared by all problems and hyperparameter sets
+    if len(argv) >= 6:
+        args["distance_cache_dir"] = argv[5]
+
+    # so is the request cache file, which lets the problems (and runs) reuse the requests of identical stations
+    if len(argv) >= 7:
+        args["request_cache_file"] = argv[6]
+
     return args
 
 def process_result(result, id_mapping, solution_dir, problem_name, algo, hyperparameters_filename, timed_out):
@@ -54,10 +67,10 @@ def process_result(result, id_mapping, solution_dir, problem_name, algo, hyperpa
 
     return [cost, solution_time, timed_out]
 
-def run_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, hyperparameters, result):
-    result["result"] = solver.solve(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, hyperparameters)
+def run_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, hyperparameters, options, result):
+    result["result"] = solver.solve(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, hyperparameters, options)
 
-def test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, algorithm_name, hyperparameters):
+def test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, algorithm_name, hyperparameters, options):
     print("    " + algorithm_name + " - attempts: ", end="")
     # result = None
     manager = multiprocessing.Manager()
@@ -67,11 +80,11 @@ def test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_ca
     while num_attempts < 2 and result.get("result") is None:
         print(num_attempts + 1, end = " ")
         # p = multiprocessing.Process(target = solver.solve, args = (coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, hyperparameters))
-        p = multiprocessing.Process(target = run_algorithm, args = (coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, hyperparameters, result))
+        p = multiprocessing.Process(target = run_algorithm, args = (coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, hyperparameters, options, result))
         p.start()
 
-        # wait for 5 minutes
-        p.join(300)
+        # wait for the search to use up its time limit
+        p.join(TIME_LIMIT + TIME_LIMIT_GRACE)
 
         # terminate the function if it is still running
         if p.is_alive():
@@ -79,6 +92,10 @@ def test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_ca
             p.join()
             timed_out = True
             print(" - timed out", end = " ")
+        elif result.get("result") is not None and result.get("result").get("search_stats").get("stop_reason") == "time_limit":
+            # the search was stopped by the time limit, but it returned the best solution it had found
+            timed_out = True
+            print(" - time limit reached", end = " ")
         # result = solver.solve(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, hyperparameters)
         num_attempts += 1
     print( ("[solution found]" if result.get("result") is not None else "[fail]") )
@@ -86,7 +103,7 @@ def test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_ca
     # return result, num_attempts, timed_out
     return result.get("result"), num_attempts, timed_out
 
-def test_single_problem(hyperparameters_filename, hyperparameters, problem_dir, filename, solution_dir):
+def test_single_problem(hyperparameters_filename, hyperparameters, problem_dir, filename, solution_dir, options):
     # load the problem specification
     problem_specs = utils.load_problem_specs(problem_dir + filename)
     if problem_specs is None:
@@ -102,10 +119,10 @@ def test_single_problem(hyperparameters_filename, hyperparameters, problem_dir,
     vehicle_capacity = problem_specs.get("vehicles").get("capacity")
 
     # test SA on SBRP
-    result_SBRP, SBRP_num_attempts, SBRP_timed_out = test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, "1", "SBRP", hyperparameters)
+    result_SBRP, SBRP_num_attempts, SBRP_timed_out = test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, "1", "SBRP", hyperparameters, options)
 
     # test SA on multiple OnePDTSPs
-    result_OnePDTSP, OnePDTSP_num_attempts, OnePDTSP_timed_out = test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, "2", "OnePDTSP", hyperparameters)
+    result_OnePDTSP, OnePDTSP_num_attempts, OnePDTSP_timed_out = test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, "2", "OnePDTSP", hyperparameters, options)
 
     problem_name = filename[:len(filename) - 5]
     stats_SBRP = process_result(result_SBRP, id_mapping, solution_dir, problem_name, "SBRP", hyperparameters_filename[:len(hyperparameters_filename) - 5], SBRP_timed_out)
@@ -113,7 +130,7 @@ def test_single_problem(hyperparameters_filename, hyperparameters, problem_dir,
 
     return [problem_name] + [SBRP_num_attempts] + stats_SBRP + [OnePDTSP_num_attempts] + stats_OnePDTSP
 
-def test_hyperparameter_set(stats_df, hyperparameters_dir, hyperparameters_file, problem_dir, problem_files, solution_dir):
+def test_hyperparameter_set(stats_df, hyperparameters_dir, hyperparameters_file, problem_dir, problem_files, solution_dir, options):
     try:
         # open the hyperparameters file
         with open(hyperparameters_dir + hyperparameters_file) as file:
@@ -122,7 +139,7 @@ def test_hyperparameter_set(stats_df, hyperparameters_dir, hyperparameters_file,
         print("Testing: " + hyperparameters_file)
         for filename in problem_files:
             print("  " + filename + ":")
-            problem_row = test_single_problem(hyperparameters_file, hyperparameters, problem_dir, filename, solution_dir)
+            problem_row = test_single_problem(hyperparameters_file, hyperparameters, problem_dir, filename, solution_dir, options)
             stats_df.loc[len(stats_df)] = [hyperparameters_file] + problem_row
 
         print("--------------------------")
@@ -161,8 +178,14 @@ def main():
     hyperparameter_files = sorted(os.listdir(hyperparameters_dir))
     hyperparameter_files = [ file for file in hyperparameter_files if file[len(file) - 5:] == ".json" ]
 
+    options = {
+        "distance_cache_dir": args.get("distance_cache_dir"),
+        "request_cache_file": args.get("request_cache_file"),
+        "time_limit": TIME_LIMIT
+    }
+
     for file in hyperparameter_files:
-        stats_df = test_hyperparameter_set(stats_df, hyperparameters_dir, file, problem_dir, problem_files, solution_dir)
+        stats_df = test_hyperparameter_set(stats_df, hyperparameters_dir, file, problem_dir, problem_files, solution_dir, options)
 
     # replace all the None values with "-"
     stats_df = stats_df.fillna("-")
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3.7
 
 import sys
+import json
 import utils
 import solver
 
@@ -13,6 +14,28 @@ import solver
 # @return dictionary with parameters if correct number of parameters, otherwise: None
 #
 def parse_args(argv):
+    # the options of the solver (see solver.default_options) are given as --option=value and can appear anywhere
+    options = {}
+    positional_argv = []
+    for arg in argv:
+        if arg.startswith("--"):
+            option, separator, value = arg[2:].partition("=")
+            if option not in solver.default_options or separator == "":
+                print("Incorrect option: " + arg + "\n" + utils.get_help())
+                return None
+
+            # the values are parsed as JSON (numbers, true/false, null), anything else is kept as a string
+            try:
+                options[option] = json.loads(value)
+            except json.decoder.JSONDecodeError:
+                options[option] = value
+
+            if option in solver.option_values and options[option] not in solver.option_values.get(option):
+                print("Incorrect value of the option: " + arg + " (available: " + ", ".join(solver.option_values.get(option)) + ")\n" + utils.get_help())
+                return None
+        else:
+            positional_argv.append(arg)
+    argv = positional_argv
 
     # array cannot be empty
     if len(argv) == 0:
@@ -36,7 +59,8 @@ def parse_args(argv):
     # if we get here, required no. of params satisfied
 
     params = {
-        "problem_file_path": argv[1]
+        "problem_file_path": argv[1],
+        "options": options
     }
 
     # parse optional arguments if provided
@@ -100,7 +124,12 @@ def main():
     # print("-------------------")
     # print(str(vehicle_num) + "     " + str(vehicle_capacity))
 
-    result = solver.solve(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm = args.get("algorithm_code", "1"))
+    # the values of the options that are only checked by the solver (e.g. a checkpoint of another problem) raise a ValueError
+    try:
+        result = solver.solve(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm = args.get("algorithm_code", "1"), options = args.get("options"))
+    except ValueError as e:
+        print("Incorrect options: " + str(e) + "\n" + utils.get_help())
+        return
 
     if result is None:
         print("Solution not found")
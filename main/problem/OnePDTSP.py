@@ -1,14 +1,18 @@
 from .Problem import Problem
 from .OnePDTSP_Solution import OnePDTSP_Solution
-from .utils import depth_first_search
+from .utils import construct_path
 
 class OnePDTSP(Problem):
     # implements the generate_solution() method from the class Problem
     def generate_solution(self):
-        vehicle_path = depth_first_search([0], self.distance_matrix, self.requests, 0, self.vehicle_capacity, self.vehicle_capacity)
+        vehicle_path = construct_path(self.distance_matrix, self.requests, self.vehicle_capacity, self.min_required_loads, self.max_required_loads, self.construction)
         if vehicle_path is None:
             return None
 
         cost = OnePDTSP_Solution.compute_cost(vehicle_path, self.distance_matrix)
 
         return OnePDTSP_Solution(self, vehicle_path, cost)
+
+    # implements the restore_solution() method from the class Problem
+    def restore_solution(self, state):
+        return OnePDTSP_Solution(self, state.get("vehicle_path"), state.get("cost"))
@@ -1,67 +1,143 @@
 from .Solution import Solution
-import random
+from .PathLoadWindows import PathLoadWindows
+from .utils import generate_random_permutation, compute_integer_sqrt
 
 class OnePDTSP_Solution(Solution):
     @staticmethod
     def compute_cost(vehicle_path, distance_matrix):
         return Solution.compute_path_cost(vehicle_path, distance_matrix)
 
-    def __init__(self, problem, vehicle_path, cost):
+    __slots__ = ("_vehicle_path", "_parent", "_move", "_load_windows", "_num_checked_moves")
+
+    # A neighbour is created with the 2-opt move (point_1, point_2) applied to the parent solution
+    # instead of the vehicle path; the path is only constructed when it is first needed,
+    # i.e. once the neighbour is accepted by the search.
+    def __init__(self, problem, vehicle_path, cost, parent = None, move = None):
         self._vehicle_path = vehicle_path
+        self._parent = parent
+        self._move = move
+
+        self._load_windows = None
+        self._num_checked_moves = 0
+
         super().__init__(problem, cost)
 
     @property
     def vehicle_path(self):
+        if self._vehicle_path is None:
+            self._vehicle_path = OnePDTSP_Solution.apply_move(self._parent.vehicle_path, *self._move)
+            self._parent = None
+
         return self._vehicle_path
 
-    def is_valid(self):
-        pass
+    # the vehicle path over the vertices of the parent problem if the problem is a sub-problem
+    @property
+    def global_vehicle_path(self):
+        return self._problem.to_global(self.vehicle_path)
 
-    def generate_neighbour(self):
-        # the network only contains the depot (vertex 0) and one station
-        if len(self._problem.distance_matrix) <= 2:
-            return None
+    # The 2-opt moves (point_1, point_2) on a path of the given length are the pairs of positions
+    # with 2 <= point_2 - point_1 <= path_length - 2, see apply_move().
+    @staticmethod
+    def get_neighbourhood_size(path_length):
+        return max(0, path_length * (path_length - 3) // 2)
+
+    # the number of 2-opt moves from the solution (valid or not)
+    @property
+    def neighbourhood_size(self):
+        return OnePDTSP_Solution.get_neighbourhood_size( len(self.vehicle_path) )
+
+    # Map the move index (from 0 to the size of the neighbourhood - 1) to the move.
+    # The pairs are numbered as (0, 2), (0, 3), (1, 3), (0, 4), (1, 4), (2, 4), ... and the move
+    # (0, path_length - 1), which would reverse the whole path, is skipped.
+    @staticmethod
+    def decode_move(move, path_length):
+        if move >= (path_length - 2) * (path_length - 3) // 2:
+            move += 1
+
+        previous_point = (1 + compute_integer_sqrt(1 + 8 * move)) // 2
+        point_1 = move - previous_point * (previous_point - 1) // 2
+
+        return point_1, previous_point + 1
 
-        tested_neighbours = set()
+    # the path with the sub-path between (and excluding) point_1 and point_2 + 1 reversed
+    @staticmethod
+    def apply_move(path, point_1, point_2):
+        return path[ : point_1 + 1] + path[point_2 : point_1 : -1] + path[point_2 + 1 : ]
+
+    # The change of cost caused by the 2-opt move; only the two removed and the two added edges
+    # are looked up, as the reversed sub-path has the same cost in both directions.
+    # NOTE: this only holds for a symmetric distance matrix
+    def compute_move_cost_difference(self, point_1, point_2):
+        path = self._vehicle_path
+        distance_matrix = self._problem.distance_matrix
+
+        a = path[point_1]
+        b = path[point_1 + 1]
+        c = path[point_2]
+        d = path[point_2 + 1] if point_2 + 1 < len(path) else 0   # the last vertex is followed by the depot
+
+        return float( distance_matrix[a, c] + distance_matrix[b, d] - distance_matrix[a, b] - distance_matrix[c, d] )
+
+    # the load windows of the vehicle along the path, built on first use
+    @property
+    def load_windows(self):
+        if self._load_windows is None:
+            self._load_windows = PathLoadWindows(self.vehicle_path, self._problem)
+
+        return self._load_windows
+
+    # Check if the path after the 2-opt move is valid, from the load windows of the unchanged prefix
+    # and suffix and of the reversed segment.
+    # NOTE: while the temperature is high almost every neighbour is accepted, i.e. most solutions only
+    #       check a single move; that move is checked by scanning the new path, as building the load
+    #       windows costs more than the scan. They are built once a second move of the solution is checked.
+    #
+    # @return a pair: (whether the move is valid, the new path if it had to be constructed for the check or None)
+    def check_move(self, point_1, point_2):
+        self._num_checked_moves += 1
+        if self._num_checked_moves == 1 and self._load_windows is None:
+            new_path = OnePDTSP_Solution.apply_move(self.vehicle_path, point_1, point_2)
+            return Solution.is_path_valid(new_path, self._problem.requests, self._problem.vehicle_capacity, self._problem.min_required_loads, self._problem.max_required_loads), new_path
+
+        load_windows = self.load_windows
 
-        num_vertices = len(self._problem.distance_matrix)
-        neighbourhood_size = num_vertices * (num_vertices - 3)
+        summary = PathLoadWindows.compose(load_windows.get_prefix(point_1), load_windows.get_reversed_segment(point_1 + 1, point_2))
+        summary = PathLoadWindows.compose(summary, load_windows.get_suffix(point_2 + 1))
 
-        while len(tested_neighbours) < neighbourhood_size:
-            v = random.randint(0, len(self._vehicle_path) - 1)
-            w = (v + random.randint(2, len(self._vehicle_path) - 2)) % len(self._vehicle_path)
+        return PathLoadWindows.is_feasible(summary), None
 
-            point_1 = min(v, w)
-            point_2 = max(v, w)
+    def get_state(self):
+        return { "vehicle_path": [ int(vertex) for vertex in self.vehicle_path ], "cost": float(self._cost) }
 
-            neighbour_signature = str( (point_1, point_2) )
-            if neighbour_signature not in tested_neighbours:
-                tested_neighbours.add(neighbour_signature)
+    def is_valid(self):
+        pass
 
-                new_path = []
+    def generate_neighbour(self):
+        # the network only contains the depot (vertex 0) and one station
+        if len(self._problem.distance_matrix) <= 2:
+            return None
 
-                # construct the new path with the 2-opt change
-                index = 0
-                step = 1
-                while index < len(self._vehicle_path):
-                    vertex = self._vehicle_path[index]
-                    new_path.append(vertex)
+        vehicle_path = self.vehicle_path
 
-                    if index == point_1:
-                        index = point_2
-                        step = -1
-                    elif index == point_1 + 1:
-                        index = point_2 + 1
-                        step = 1
-                    else:
-                        index += step
+        # evaluate the 2-opt moves in a random order until a valid one is found
+        for move in generate_random_permutation( OnePDTSP_Solution.get_neighbourhood_size(len(vehicle_path)), self._problem.rng ):
+            point_1, point_2 = OnePDTSP_Solution.decode_move(move, len(vehicle_path))
 
-                # check if the new solution is valid
-                if Solution.is_path_valid(new_path, self._problem.requests, self._problem.vehicle_capacity):
+            # check if the new solution is valid, the path itself is (usually) only constructed if the neighbour is accepted
+            is_valid, new_path = self.check_move(point_1, point_2)
+            if is_valid:
+                if self._problem.is_symmetric:
+                    new_cost = self._cost + self.compute_move_cost_difference(point_1, point_2)
+                else:
+                    if new_path is None:
+                        new_path = OnePDTSP_Solution.apply_move(vehicle_path, point_1, point_2)
                     new_cost = OnePDTSP_Solution.compute_cost(new_path, self._problem.distance_matrix)
 
+                if new_path is not None:
                     return OnePDTSP_Solution(self._problem, new_path, new_cost)
 
+                return OnePDTSP_Solution(self._problem, None, new_cost, self, (point_1, point_2))
+
         return None
         # Alternative way of generating a neighbour - reverse some sequence of stations:
         # start = random.randint(1, len(self._vehicle_path) - 2)
@@ -76,13 +152,7 @@ class OnePDTSP_Solution(Solution):
         if len(self._problem.distance_matrix) == 1:
             return 0
 
-        # flatten the distance matrix into a list of distances
-        distances = [ dist for row in self._problem.distance_matrix for dist in row ]
-
-        # sort the list in ascending order
-        distances = sorted(distances)
-
         # compute the cost difference by subtracting the n-1 shortest distances from the n-1 longest,
         # where n is the number of vertices
-        num_vertices = len(self._problem.distance_matrix)
-        return sum(distances[len(distances) - num_vertices + 1 : ]) - sum(distances[ : num_vertices - 1])
+        shortest_distances, longest_distances = self._problem.get_extreme_distance_sums( len(self._problem.distance_matrix) - 1 )
+        return longest_distances - shortest_distances
@@ -0,0 +1,70 @@
+import numpy as np
+
+# A symmetric distance matrix that only stores its upper triangle (including the diagonal)
+# in a contiguous 1-dimensional array, which halves the memory of the square layout.
+#
+# The entries are accessed in the same way as in a numpy array, i.e. matrix[v, w] for a single
+# distance and matrix[rows, cols] for many. The list-style matrix[v][w] and iterating over
+# the rows also work (each row is assembled on access), so that the code written for
+# a list of lists keeps working.
+class PackedDistanceMatrix:
+    def __init__(self, distance_matrix):
+        distance_matrix = np.asarray(distance_matrix)
+        rows, cols = np.triu_indices(len(distance_matrix))
+
+        self._size = len(distance_matrix)
+        self._data = np.ascontiguousarray(distance_matrix[rows, cols])
+
+    # position of the entry (v, w) in the packed array, works element-wise on arrays as well
+    def _index(self, v, w):
+        low = np.minimum(v, w)
+        high = np.maximum(v, w)
+        return low * self._size - low * (low - 1) // 2 + (high - low)
+
+    @property
+    def shape(self):
+        return (self._size, self._size)
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            v, w = key
+
+            # fast path for a single entry
+            if isinstance(v, (int, np.integer)) and isinstance(w, (int, np.integer)):
+                if v > w:
+                    v, w = w, v
+                return self._data[v * self._size - v * (v - 1) // 2 + (w - v)]
+
+            return self._data[ self._index( np.asarray(v), np.asarray(w) ) ]
+
+        # a single row
+        return self._data[ self._index(key, np.arange(self._size)) ]
+
+    # the entries on the diagonal and the entries above it, each of the latter appears twice in the full matrix
+    def get_triangle_entries(self):
+        diagonal = self._index( np.arange(self._size), np.arange(self._size) )
+
+        above_diagonal = np.ones(len(self._data), dtype = bool)
+        above_diagonal[diagonal] = False
+
+        return self._data[diagonal], self._data[above_diagonal]
+
+    def __iter__(self):
+        for v in range(0, self._size):
+            yield self[v]
+
+    def __array__(self, dtype = None, copy = None):
+        rows, cols = np.indices(self.shape)
+        matrix = self._data[ self._index(rows, cols) ]
+        return matrix if dtype is None else matrix.astype(dtype)
@@ -0,0 +1,121 @@
+import numpy as np
+
+# The loads with which a vehicle can traverse the parts of a path, as composable summaries.
+#
+# The summary (A, B, R) of a sequence of stations means that a vehicle can visit the stations in order
+# if and only if it arrives at the first one with a load in [A, B], and that it leaves the last one with
+# that load plus R (the sum of the requests). A single station has the summary (min required load,
+# max required load, request), see compute_required_loads(), and the summary of a sequence followed by
+# another sequence is:
+#
+#   (A1, B1, R1) + (A2, B2, R2) = ( max(A1, A2 - R1), min(B1, B2 - R1), R1 + R2 )
+#
+# i.e. a sequence is feasible if A <= B. The depot is treated as a station with the summary (0, C, 0),
+# so that every prefix of the path (which starts with the depot) also accounts for the empty initial load
+# window [0, C] and the initial load of a feasible path is the A of its whole summary.
+#
+# The summary of any prefix or suffix of the path is answered in O(1) from the accumulated maxima and minima,
+# and the one of a reversed segment (the 2-opt move) in O(1) from sparse tables built on the first such query.
+class PathLoadWindows:
+    # the summary of an empty sequence of stations
+    EMPTY = (float("-inf"), float("inf"), 0)
+
+    @staticmethod
+    def compose(summary_1, summary_2):
+        A_1, B_1, R_1 = summary_1
+        A_2, B_2, R_2 = summary_2
+
+        return max(A_1, A_2 - R_1), min(B_1, B_2 - R_1), R_1 + R_2
+
+    @staticmethod
+    def is_feasible(summary):
+        return summary[0] <= summary[1]
+
+    # @param path - a path starting with the depot (vertex 0)
+    # @param problem - the problem the path is a part of a solution to, see Problem.load_window_arrays
+    def __init__(self, path, problem):
+        min_required_loads, max_required_loads, requests = problem.load_window_arrays
+
+        path = np.asarray(path, dtype = np.intp)
+        path_min_required_loads = min_required_loads[path]
+        path_max_required_loads = max_required_loads[path]
+        path_requests = requests[path]
+
+        # the net request of the stations up to (and including) each position, and up to the previous position
+        cumulative_requests = np.cumsum(path_requests)
+        previous_requests = cumulative_requests - path_requests
+
+        # the bounds on the load at the start of the path required by each position
+        forward_min_loads = path_min_required_loads - previous_requests
+        forward_max_loads = path_max_required_loads - previous_requests
+
+        self._prefix_min_loads = np.maximum.accumulate(forward_min_loads).tolist()
+        self._prefix_max_loads = np.minimum.accumulate(forward_max_loads).tolist()
+        self._suffix_min_loads = np.maximum.accumulate(forward_min_loads[::-1])[::-1].tolist()
+        self._suffix_max_loads = np.minimum.accumulate(forward_max_loads[::-1])[::-1].tolist()
+
+        self._cumulative_requests = cumulative_requests.tolist()
+        self._previous_requests = previous_requests.tolist()
+
+        # the bounds on the load at the end of a segment required by each position when the segment is reversed
+        self._backward_min_loads = path_min_required_loads + cumulative_requests
+        self._backward_max_loads = path_max_required_loads + cumulative_requests
+        self._backward_min_loads_table = None
+        self._backward_max_loads_table = None
+
+    def __len__(self):
+        return len(self._cumulative_requests)
+
+    # the initial load of the vehicle, i.e. the smallest load with which it can start the path
+    # NOTE: the path has to be feasible
+    @property
+    def initial_load(self):
+        return self._prefix_min_loads[-1]
+
+    # the summary of the path up to (and including) the given position
+    def get_prefix(self, position):
+        return self._prefix_min_loads[position], self._prefix_max_loads[position], self._cumulative_requests[position]
+
+    # the summary of the path from the given position (1 or more) to its end
+    def get_suffix(self, position):
+        if position >= len(self):
+            return PathLoadWindows.EMPTY
+
+        previous_request = self._previous_requests[position]
+
+        return self._suffix_min_loads[position] + previous_request, self._suffix_max_loads[position] + previous_request, self._cumulative_requests[-1] - previous_request
+
+    # the summary of the path from the position start to the position end (1 or more), visited in the reverse order
+    def get_reversed_segment(self, start, end):
+        if start > end:
+            return PathLoadWindows.EMPTY
+
+        if self._backward_min_loads_table is None:
+            self._backward_min_loads_table = PathLoadWindows.build_sparse_table(self._backward_min_loads, np.maximum)
+            self._backward_max_loads_table = PathLoadWindows.build_sparse_table(self._backward_max_loads, np.minimum)
+
+        # the two (overlapping) ranges of length 2^level that cover the segment
+        level = (end - start + 1).bit_length() - 1
+        other_start = end - (1 << level) + 1
+
+        min_loads = self._backward_min_loads_table[level]
+        max_loads = self._backward_max_loads_table[level]
+        cumulative_request = self._cumulative_requests[end]
+
+        return (max(min_loads[start], min_loads[other_start]) - cumulative_request,
+            min(max_loads[start], max_loads[other_start]) - cumulative_request,
+            cumulative_request - self._previous_requests[start])
+
+    # The sparse table of the values, i.e. the list of levels where table[level][i] is the result of
+    # reducing the values from i to i + 2^level - 1 with the given function (np.maximum or np.minimum).
+    @staticmethod
+    def build_sparse_table(values, function):
+        table = [ values ]
+
+        width = 1
+        while 2 * width <= len(values):
+            previous_level = table[-1]
+            table.append( function(previous_level[ : -width], previous_level[width : ]) )
+            width *= 2
+
+        return [ level.tolist() for level in table ]
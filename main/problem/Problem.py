@@ -1,15 +1,79 @@
 from abc import ABC, abstractmethod
+import random
+import numpy as np
+from .PackedDistanceMatrix import PackedDistanceMatrix
+from .SubDistanceMatrix import SubDistanceMatrix
+from .utils import compute_required_loads, compute_extreme_distance_sums, CONSTRUCTIONS
 
 class Problem(ABC):
-    def __init__(self, distance_matrix, requests, vehicle_capacity):
+    # The distance matrix is stored as a contiguous numpy array of the given dtype (float64 or float32).
+    # If packed is True and the matrix is symmetric, only its upper triangle is kept (see PackedDistanceMatrix).
+    # NOTE: with float32 the costs accumulate float32 rounding errors (of the order of centimetres on a city network)
+    #
+    # If the distance matrix is a SubDistanceMatrix, the problem is defined on its vertices only, i.e. it is a sub-problem
+    # of the problem on the parent matrix. Its vertices are numbered locally and to_global() maps them back.
+    #
+    # The construction is the way the initial path of a vehicle is constructed, see utils.CONSTRUCTIONS.
+    def __init__(self, distance_matrix, requests, vehicle_capacity, dtype = np.float64, packed = False, construction = "greedy"):
+        if construction not in CONSTRUCTIONS:
+            raise ValueError("Unknown construction: " + str(construction) + " (available: " + ", ".join(CONSTRUCTIONS) + ")")
+
+        self._vertices = None
+        if isinstance(distance_matrix, SubDistanceMatrix):
+            self._vertices = distance_matrix.vertices
+            distance_matrix = distance_matrix.materialize()
+
+        # NOTE: an array (or memory-mapped file) of the right dtype is not copied
+        distance_matrix = np.ascontiguousarray(distance_matrix, dtype = dtype)
+
+        self._is_symmetric = bool( np.array_equal(distance_matrix, distance_matrix.T) )
+        if packed and self._is_symmetric:
+            distance_matrix = PackedDistanceMatrix(distance_matrix)
+
         self._distance_matrix = distance_matrix
         self._requests = requests
         self._vehicle_capacity = vehicle_capacity
+        self._construction = construction
+
+        # the range of loads with which a vehicle can arrive at each station, see compute_required_loads()
+        self._min_required_loads, self._max_required_loads = compute_required_loads(requests, vehicle_capacity)
+        self._load_window_arrays = None
+        self._extreme_distance_sums = {}
+
+        # the random number generator used by the search, None for the random module (see the rng property)
+        self._rng = None
 
     @property
     def distance_matrix(self):
         return self._distance_matrix
 
+    @property
+    def is_symmetric(self):
+        return self._is_symmetric
+
+    # the vertices of the parent problem that correspond to the vertices of this problem, None if it is not a sub-problem
+    @property
+    def vertices(self):
+        return self._vertices
+
+    # map a path over the vertices of this problem to the vertices of the parent problem
+    def to_global(self, path):
+        if self._vertices is None:
+            return list(path)
+
+        return self._vertices[path].tolist()
+
+    # The random number generator (random.Random instance) from which the solutions of the problem draw
+    # their random numbers; the random module itself if none was set. Each chain of the search is given
+    # its own seeded generator, which makes it reproducible.
+    @property
+    def rng(self):
+        return self._rng if self._rng is not None else random
+
+    @rng.setter
+    def rng(self, rng):
+        self._rng = rng
+
     @property
     def requests(self):
         return self._requests
@@ -18,8 +82,48 @@ class Problem(ABC):
     def vehicle_capacity(self):
         return self._vehicle_capacity
 
+    @property
+    def construction(self):
+        return self._construction
+
+    @property
+    def min_required_loads(self):
+        return self._min_required_loads
+
+    @property
+    def max_required_loads(self):
+        return self._max_required_loads
+
+    # The sums of the given number of shortest and of longest distances of the matrix (including the zeros on its diagonal),
+    # see compute_extreme_distance_sums(); computed once for each number and cached, as they only depend on the distances.
+    #
+    # @return a pair: (sum of the shortest distances, sum of the longest distances)
+    def get_extreme_distance_sums(self, count):
+        if count not in self._extreme_distance_sums:
+            self._extreme_distance_sums[count] = compute_extreme_distance_sums(self._distance_matrix, count)
+
+        return self._extreme_distance_sums[count]
+
+    # the required loads and the requests as numpy arrays indexed by vertex, where the depot (vertex 0)
+    # accepts any load and has no request, see PathLoadWindows
+    @property
+    def load_window_arrays(self):
+        if self._load_window_arrays is None:
+            self._load_window_arrays = (
+                np.array([ 0 ] + list(self._min_required_loads), dtype = np.int64),
+                np.array([ self._vehicle_capacity ] + list(self._max_required_loads), dtype = np.int64),
+                np.array([ 0 ] + list(self._requests), dtype = np.int64)
+            )
+
+        return self._load_window_arrays
+
     # This needs to be an abstract method, to be implemented by each concrete class
     # It is a standard method (i.e. neither a class method nor a static method)
     @abstractmethod
     def generate_solution(self):
         return
+
+    # Recreate a solution of the problem from its state, see Solution.get_state()
+    @abstractmethod
+    def restore_solution(self, state):
+        return
@@ -1,28 +1,66 @@
+import numpy as np
 from .Problem import Problem
 from .SBRP_Solution import SBRP_Solution
-from .utils import depth_first_search, tabu_search
+from .OnePDTSP import OnePDTSP
+from .SubDistanceMatrix import SubDistanceMatrix
+from .utils import construct_path, construct_savings_paths, assign_stations, ASSIGNMENTS
+
+# The ways of generating the initial solution:
+#   assignment - assign the stations to the vehicles by their requests (see assign_stations()) and construct a path through each group
+#   savings    - merge the routes of the stations by the savings heuristic (see construct_savings_paths()), which follows the distances;
+#                if the routes cannot be merged into vehicle_num, the stations are assigned as above
+INITIAL_SOLUTIONS = ("assignment", "savings")
 
 class SBRP(Problem):
-    def __init__(self, distance_matrix, requests, vehicle_num, vehicle_capacity):
+    def __init__(self, distance_matrix, requests, vehicle_num, vehicle_capacity, dtype = np.float64, packed = False, construction = "greedy", initial_solution = "assignment", assignment = "differencing"):
+        if initial_solution not in INITIAL_SOLUTIONS:
+            raise ValueError("Unknown initial solution: " + str(initial_solution) + " (available: " + ", ".join(INITIAL_SOLUTIONS) + ")")
+        if assignment not in ASSIGNMENTS:
+            raise ValueError("Unknown assignment: " + str(assignment) + " (available: " + ", ".join(ASSIGNMENTS) + ")")
+
         self._vehicle_num = vehicle_num
-        super().__init__(distance_matrix, requests, vehicle_capacity)
+        self._initial_solution = initial_solution
+        self._assignment = assignment
+        super().__init__(distance_matrix, requests, vehicle_capacity, dtype, packed, construction)
 
     @property
     def vehicle_num(self):
         return self._vehicle_num
 
+    @property
+    def initial_solution(self):
+        return self._initial_solution
+
+    @property
+    def assignment(self):
+        return self._assignment
+
+    # Create the 1-PDTSP restricted to a group of vertices, i.e. the route of a single vehicle.
+    # NOTE: the group has to start with the depot (vertex 0); the paths of the solutions to
+    #       the returned problem are mapped back to the vertices of this problem by its to_global()
+    def get_group_problem(self, group):
+        group_requests = [ self.requests[vertex - 1] for vertex in group[1:] ]
+
+        group_problem = OnePDTSP(SubDistanceMatrix(self.distance_matrix, group), group_requests, self.vehicle_capacity, self.distance_matrix.dtype, construction = self.construction)
+        group_problem.rng = self._rng
+
+        return group_problem
+
     # implements the generate_solution() method from the class Problem
     def generate_solution(self):
+        if self._initial_solution == "savings":
+            vehicle_paths = construct_savings_paths(self.distance_matrix, self.requests, self.vehicle_num, self.vehicle_capacity, self.min_required_loads, self.max_required_loads)
+            if vehicle_paths is not None:
+                return SBRP_Solution(self, vehicle_paths, SBRP_Solution.compute_cost(vehicle_paths, self.distance_matrix))
+
         # assign each station to one of vehicle_num possible groups
-        station_assignments = tabu_search(self.requests, self.vehicle_num, self.vehicle_capacity)
+        station_assignments = assign_stations(self.requests, self.vehicle_num, self.vehicle_capacity, self.rng, self.assignment)
         # print(station_groups)     # <- for debugging only
 
         if station_assignments is None:
             return None
 
         # construct the actual vertex groups
-        # NOTE: vertices in each group are sorted by ID in an increasing order
-        #       which is important later on
         groups = [ [0] for vehicle in range(0, self.vehicle_num) ]
         for station, group in enumerate(station_assignments):
             groups[group].append(station + 1)
@@ -34,26 +72,23 @@ class SBRP(Problem):
             if len(group) == 1:
                 vehicle_paths.append([0])
             else:
-                # compute the distance matrix for the group of vertices
-                group_distance_matrix = [ [dist for w, dist in enumerate(distances) if w in group] for v, distances in enumerate(self.distance_matrix) if v in group ]
+                # view the distance matrix of the group of vertices
+                group_distance_matrix = SubDistanceMatrix(self.distance_matrix, group)
 
-                # compute the list of requests for the stations included in the group
-                group_requests = [ request for station, request in enumerate(self.requests) if (station + 1) in group ]
+                # compute the list of requests (and required loads) for the stations included in the group
+                group_requests = [ self.requests[vertex - 1] for vertex in group[1:] ]
+                group_min_required_loads = [ self.min_required_loads[vertex - 1] for vertex in group[1:] ]
+                group_max_required_loads = [ self.max_required_loads[vertex - 1] for vertex in group[1:] ]
 
                 # find a valid path through the group
-                path = depth_first_search([0], group_distance_matrix, group_requests, 0, self.vehicle_capacity, self.vehicle_capacity)
+                path = construct_path(group_distance_matrix, group_requests, self.vehicle_capacity, group_min_required_loads, group_max_required_loads, self.construction)
 
                 if path is None:    # should not happen if the grouping was done correctly
                     return None
 
                 # map the vertex indices from group back to general
-                # NOTE: this is where it is important that the group is sorted
                 # depot (vertex 0) will be mapped back to itself correctly
-                for path_index, group_index in enumerate(path):
-                    index = group[group_index]
-                    path[path_index] = index
-
-                vehicle_paths.append(path)
+                vehicle_paths.append( group_distance_matrix.to_global(path) )
 
         # print(vehicle_paths)    # <- for debugging only
 
@@ -61,3 +96,7 @@ class SBRP(Problem):
         # print(cost) # <- for debugging only
 
         return SBRP_Solution(self, vehicle_paths, cost)
+
+    # implements the restore_solution() method from the class Problem
+    def restore_solution(self, state):
+        return SBRP_Solution(self, state.get("vehicle_paths"), state.get("cost"))
@@ -1,5 +1,8 @@
 from .Solution import Solution
-import random
+from .PathLoadWindows import PathLoadWindows
+from .utils import generate_random_permutation
+import bisect
+import itertools
 
 class SBRP_Solution(Solution):
     @staticmethod
@@ -11,19 +14,15 @@ class SBRP_Solution(Solution):
 
         return cost
 
+    # NOTE: the OnePDTSP solutions have to be solutions to the group problems of the given SBRP problem, see SBRP.get_group_problem()
     @staticmethod
-    def construct_from_OnePDTSPs(solutions, groups, problem):
+    def construct_from_OnePDTSPs(solutions, problem):
         # reconstruct the solutions
         reconstructed_paths = []
         total_cost = 0
-        for solution, group in zip(solutions, groups):
+        for solution in solutions:
             total_cost += solution.cost
-
-            reconstructed = []
-            for vertex in solution.vehicle_path:
-                reconstructed.append(group[vertex])
-
-            reconstructed_paths.append(reconstructed)
+            reconstructed_paths.append(solution.global_vehicle_path)
 
         if len(reconstructed_paths) < problem.vehicle_num:
             missing_vehicles_num = problem.vehicle_num - len(reconstructed_paths)
@@ -32,21 +31,42 @@ class SBRP_Solution(Solution):
 
         return SBRP_Solution(problem, reconstructed_paths, total_cost)
 
-    def __init__(self, problem, vehicle_paths, cost):
+    __slots__ = ("_vehicle_paths", "_load_windows", "_path_starts")
+
+    # NOTE: the load windows of the paths that are shared with another solution can be given, the others are built on first use
+    def __init__(self, problem, vehicle_paths, cost, load_windows = None):
         self._vehicle_paths = vehicle_paths
+        self._load_windows = load_windows if load_windows is not None else [ None for path in vehicle_paths ]
+
+        # the stations of all the paths are numbered consecutively (path by path), path_starts holds the number
+        # of the first station of each path (and the number of stations as the last item)
+        self._path_starts = [0] + list( itertools.accumulate( [ len(path) - 1 for path in vehicle_paths ] ) )
+
         super().__init__(problem, cost)
 
     @property
     def vehicle_paths(self):
         return self._vehicle_paths
 
+    # The number of moves from the solution (valid or not).
+    # A move is encoded as: station number * (vehicle_num - 1) + vehicle offset, i.e. the station
+    # from which the sub-path is reassigned and the new vehicle (old_vehicle + vehicle offset + 1) % vehicle_num
+    @property
+    def neighbourhood_size(self):
+        return self._path_starts[-1] * (self._problem.vehicle_num - 1)
+
+    # the load windows of the path of the given vehicle, see PathLoadWindows
+    def get_load_windows(self, vehicle):
+        if self._load_windows[vehicle] is None:
+            self._load_windows[vehicle] = PathLoadWindows(self._vehicle_paths[vehicle], self._problem)
+
+        return self._load_windows[vehicle]
+
     def get_initial_loads(self):
-        init_loads = []
-        for path in self._vehicle_paths:
-            load = Solution.compute_initial_load(path, self._problem.requests, self._problem.vehicle_capacity)
-            init_loads.append(load)
+        return [ self.get_load_windows(vehicle).initial_load for vehicle in range(0, len(self._vehicle_paths)) ]
 
-        return init_loads
+    def get_state(self):
+        return { "vehicle_paths": [ [ int(vertex) for vertex in path ] for path in self._vehicle_paths ], "cost": float(self._cost) }
 
     def is_valid(self):
         pass
@@ -56,68 +76,108 @@ class SBRP_Solution(Solution):
         #       return False
         # return True
 
-    def generate_neighbour(self):
-        tested_neighbours = set()
+    # The solution can also be changed in place (see simulated_annealing()): propose_move() finds a valid move
+    # without changing the solution, apply_move() and undo_move() make and revert it, and snapshot() copies
+    # the solution (e.g. to keep the best one found).
+    #
+    # A move reassigns the end of the path of old_vehicle, from reassignment_point on, to the end of the path
+    # of new_vehicle. It is the tuple:
+    #   (new cost, old cost, old_vehicle, reassignment_point, new_vehicle, length of the path of new_vehicle before the move)
+    # i.e. its first item is always the cost of the solution after the move.
+    def propose_move(self):
+        vehicle_num = self._problem.vehicle_num
+        path_starts = self._path_starts
 
-        stations_num = len(self._problem.requests)
-        neighbourhood_size = stations_num * (self._problem.vehicle_num - 1)
+        # evaluate the moves in a random order until a valid one is found
+        for move in generate_random_permutation( self.neighbourhood_size, self._problem.rng ):
+            station, vehicle_offset = divmod(move, vehicle_num - 1)
 
-        while len(tested_neighbours) < neighbourhood_size:
-            # get the list of vehicles that visit some stations, i.e. their list does not just include the vertex 0
-            non_empty_vehicles = [ vehicle for vehicle, path in enumerate(self._vehicle_paths) if len(path) > 1 ]
+            # the vehicle that visits the station, from which the sub-path will be removed
+            # NOTE: empty paths share their start with the next path, bisect_right() skips them
+            old_vehicle = bisect.bisect_right(path_starts, station, 0, vehicle_num) - 1
 
-            # find a random valid vehicle from which a sub-path will be removed
-            # old_vehicle = random.randint(0, self._problem.vehicle_num - 1)
-            old_vehicle = random.choice(non_empty_vehicles)
+            # the point on the old vehicle path from which it will be reassigned to a new vehicle
+            reassignment_point = station - path_starts[old_vehicle] + 1
 
-            # get a random point on the old vehicle path from which it will be reassigned to a new vehicle
-            reassignment_point = random.randint(1, len(self._vehicle_paths[old_vehicle]) - 1)
+            # the new vehicle, it is different than the old vehicle
+            new_vehicle = (old_vehicle + vehicle_offset + 1) % vehicle_num
 
-            # choose the new vehicle at random, it is different than the old vehicle
-            new_vehicle = ( old_vehicle + random.randint(1, self._problem.vehicle_num - 1) ) % self._problem.vehicle_num
+            # the path of the new vehicle is valid if its current path can be followed by the sub-path to reassign,
+            # the old vehicle path remains valid as we only remove stations from the end
+            summary = PathLoadWindows.compose(self.get_load_windows(new_vehicle).get_prefix(-1), self.get_load_windows(old_vehicle).get_suffix(reassignment_point))
+            if PathLoadWindows.is_feasible(summary):
+                old_path = self._vehicle_paths[old_vehicle]
+                new_path = self._vehicle_paths[new_vehicle]
 
-            neighbour_signature = str( (old_vehicle, reassignment_point, new_vehicle) )
-            if neighbour_signature not in tested_neighbours:
-                tested_neighbours.add( neighbour_signature )
+                station_1 = old_path[reassignment_point - 1] # new end of the old vehicle path
+                station_2 = old_path[reassignment_point] # start of the path to reassign
+                station_3 = new_path[-1] # current end of the new vehicle path, i.e. the point to which the path to reassign is appended
 
-                # the list of vehicle paths needs to be copied so that we do not ruin the original one
-                new_paths = [ path.copy() for path in self._vehicle_paths ]
+                new_cost = self._cost
 
-                station_1 = new_paths[old_vehicle][reassignment_point - 1] # new end of the old vehicle path
-                station_2 = new_paths[old_vehicle][reassignment_point] # start of the path to reassign
-                station_3 = new_paths[new_vehicle][-1] # current end of the new vehicle path, i.e. the point to which the path to reassign is appended
+                # subtract the cost of edges that were removed
+                new_cost -= self._problem.distance_matrix[ station_1, station_2 ]
+                new_cost -= self._problem.distance_matrix[ station_3, 0 ]
 
-                # get the sub-path that is to be reassigned from one vehicle to another
-                path_to_reassign = new_paths[old_vehicle][reassignment_point : ]
+                # add the cost of edges that were added
+                new_cost += self._problem.distance_matrix[ station_1, 0 ]
+                new_cost += self._problem.distance_matrix[ station_3, station_2 ]
 
-                # reassign the sub-path
-                new_paths[new_vehicle] += path_to_reassign
-                new_paths[old_vehicle] = new_paths[old_vehicle][0 : reassignment_point]
+                return (new_cost, self._cost, old_vehicle, reassignment_point, new_vehicle, len(new_path))
 
-                if Solution.is_path_valid(new_paths[new_vehicle], self._problem.requests, self._problem.vehicle_capacity):   # the old vehicle path remains valid as we only remove stations from the end
-                    new_cost = self.cost
+        return None
 
-                    # subtract the cost of edges that were removed
-                    new_cost -= self._problem.distance_matrix[ station_1 ][ station_2 ]
-                    new_cost -= self._problem.distance_matrix[ station_3 ][ 0 ]
+    def apply_move(self, move):
+        new_cost, old_cost, old_vehicle, reassignment_point, new_vehicle, new_path_length = move
 
-                    # add the cost of edges that were added
-                    new_cost += self._problem.distance_matrix[ station_1 ][ 0 ]
-                    new_cost += self._problem.distance_matrix[ station_3 ][ station_2 ]
+        self.move_sub_path(old_vehicle, reassignment_point, new_vehicle)
+        self._cost = new_cost
 
-                    return SBRP_Solution(self._problem, new_paths, new_cost)
+    def undo_move(self, move):
+        new_cost, old_cost, old_vehicle, reassignment_point, new_vehicle, new_path_length = move
 
-        return None
+        self.move_sub_path(new_vehicle, new_path_length, old_vehicle)
+        self._cost = old_cost
+
+    # move the end of the path of from_vehicle, from the given point on, to the end of the path of to_vehicle
+    def move_sub_path(self, from_vehicle, point, to_vehicle):
+        from_path = self._vehicle_paths[from_vehicle]
+        to_path = self._vehicle_paths[to_vehicle]
+
+        moved_stations_num = len(from_path) - point
+        to_path.extend( itertools.islice(from_path, point, None) )
+        del from_path[point : ]
+
+        # only the load windows of the two changed paths have to be rebuilt
+        self._load_windows[from_vehicle] = None
+        self._load_windows[to_vehicle] = None
+
+        # shift the numbers of the stations on the paths between the two vehicles
+        if from_vehicle < to_vehicle:
+            for vehicle in range(from_vehicle + 1, to_vehicle + 1):
+                self._path_starts[vehicle] -= moved_stations_num
+        else:
+            for vehicle in range(to_vehicle + 1, from_vehicle + 1):
+                self._path_starts[vehicle] += moved_stations_num
+
+    # a copy of the solution that is not affected by the moves applied to this one
+    def snapshot(self):
+        return SBRP_Solution(self._problem, [ path.copy() for path in self._vehicle_paths ], self._cost, self._load_windows.copy())
+
+    def generate_neighbour(self):
+        move = self.propose_move()
+        if move is None:
+            return None
+
+        neighbour = self.snapshot()
+        neighbour.apply_move(move)
+
+        return neighbour
 
     def get_max_cost_difference(self):
         if len(self._problem.distance_matrix) == 1:
             return 0
 
-        # flatten the distance matrix into a list of distances
-        distances = [ dist for row in self._problem.distance_matrix for dist in row ]
-
-        # sort the list in ascending order
-        distances = sorted(distances)
-
         # compute the cost difference by subtracting the two shortest distances from the two longest
-        return distances[len(distances) - 1] + distances[len(distances) - 2] - distances[0] - distances[1]
+        shortest_distances, longest_distances = self._problem.get_extreme_distance_sums(2)
+        return longest_distances - shortest_distances
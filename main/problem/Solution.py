@@ -1,6 +1,10 @@
 from abc import ABC, abstractmethod
+import numpy as np
+from .utils import compute_required_loads
 
 class Solution(ABC):
+    __slots__ = ("_problem", "_cost")
+
     @staticmethod
     @abstractmethod
     def compute_cost(vehicle_paths, distance_matrix):
@@ -8,27 +12,36 @@ class Solution(ABC):
 
     @staticmethod
     def compute_path_cost(path, distance_matrix):
-        cost = 0
-        for i in range(0, len(path) - 1):
-            v = path[i]
-            w = path[i+1]
-            cost += distance_matrix[v][w]
+        # a distance matrix given as a list of lists is indexed one edge at a time
+        if isinstance(distance_matrix, list):
+            cost = 0
+            for i in range(0, len(path) - 1):
+                v = path[i]
+                w = path[i+1]
+                cost += distance_matrix[v][w]
+
+            last_vertex = path[len(path) - 1]
+            cost += distance_matrix[last_vertex][0]
 
-        last_vertex = path[len(path) - 1]
-        cost += distance_matrix[last_vertex][0]
+            return cost
 
-        return cost
+        # otherwise all the edges of the path (including the return to the depot) are looked up at once
+        path = np.asarray(path)
+        return float( distance_matrix[path[:-1], path[1:]].sum() + distance_matrix[path[-1], 0] )
 
     @staticmethod
-    def is_path_valid(path, requests, vehicle_capacity):
+    def is_path_valid(path, requests, vehicle_capacity, min_required_loads = None, max_required_loads = None):
+        if min_required_loads is None:
+            min_required_loads, max_required_loads = compute_required_loads(requests, vehicle_capacity)
+
         min_load = 0
         max_load = vehicle_capacity
 
         for vertex in path[1:]:
             station = vertex - 1
             request = requests[station]
-            min_required_load = max(0, 0 - request)
-            max_required_load = min(vehicle_capacity, vehicle_capacity - request)
+            min_required_load = min_required_loads[station]
+            max_required_load = max_required_loads[station]
 
             move_allowed = (min_load >= min_required_load and min_load <= max_required_load) or (max_load >= min_required_load and max_load <= max_required_load)
 
@@ -41,7 +54,10 @@ class Solution(ABC):
         return True
 
     @staticmethod
-    def compute_initial_load(path, requests, vehicle_capacity):
+    def compute_initial_load(path, requests, vehicle_capacity, min_required_loads = None, max_required_loads = None):
+        if min_required_loads is None:
+            min_required_loads, max_required_loads = compute_required_loads(requests, vehicle_capacity)
+
         min_load = 0
         max_load = vehicle_capacity
 
@@ -50,8 +66,8 @@ class Solution(ABC):
         for vertex in path[1:]:
             station = vertex - 1
             request = requests[station]
-            min_required_load = max(0, 0 - request)
-            max_required_load = min(vehicle_capacity, vehicle_capacity - request)
+            min_required_load = min_required_loads[station]
+            max_required_load = max_required_loads[station]
 
             # # NOTE: uncomment this snippet if the path is not guaranteed to be valid
             # move_allowed = (min_load >= min_required_load and min_load <= max_required_load) or (max_load >= min_required_load and max_load <= max_required_load)
@@ -84,6 +100,12 @@ class Solution(ABC):
     def generate_neighbour(self):
         return
 
+    # The state of the solution as a dictionary of JSON types (e.g. for a checkpoint of the search),
+    # from which the problem recreates the solution, see Problem.restore_solution()
+    @abstractmethod
+    def get_state(self):
+        return
+
     # The function returns the maximum absolute difference between the current solution (this object)
     # and its neighbours. It has to be implemented by each subclass because it's
     # result depends on the neighbourhood function
@@ -0,0 +1,46 @@
+import numpy as np
+
+# A view of the distances between a subset of the vertices of a larger distance matrix,
+# e.g. the vertices of a group of stations served by one vehicle. The local vertex i of the
+# view is the vertex vertices[i] of the parent matrix. Nothing is copied when the view is created.
+#
+# The entries are accessed as in the parent matrix (view[i, j], view[i][j] or view[rows, cols]),
+# materialize() builds the (small) square sub-matrix with a single fancy-indexing operation
+# and to_global() maps a path over the local vertices back to the vertices of the parent.
+class SubDistanceMatrix:
+    def __init__(self, distance_matrix, vertices):
+        self._parent = distance_matrix
+        self._vertices = np.asarray(vertices, dtype = np.intp)
+
+    @property
+    def vertices(self):
+        return self._vertices
+
+    @property
+    def shape(self):
+        return (len(self._vertices), len(self._vertices))
+
+    def __len__(self):
+        return len(self._vertices)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            v, w = key
+            return self._parent[ self._vertices[v], self._vertices[w] ]
+
+        # a single row
+        return self._parent[ self._vertices[key], self._vertices ]
+
+    def __iter__(self):
+        for v in range(0, len(self._vertices)):
+            yield self[v]
+
+    def materialize(self):
+        return np.asarray( self._parent[ np.ix_(self._vertices, self._vertices) ] )
+
+    def __array__(self, dtype = None, copy = None):
+        matrix = self.materialize()
+        return matrix if dtype is None else matrix.astype(dtype)
+
+    def to_global(self, path):
+        return self._vertices[path].tolist()
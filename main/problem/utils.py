@@ -1,69 +1,419 @@
+import math
 import random
+import bisect
+import heapq
+from collections import deque
+import numpy as np
+from .PackedDistanceMatrix import PackedDistanceMatrix
+from .PathLoadWindows import PathLoadWindows
 
-def depth_first_search(path, distance_matrix, requests, min_load, max_load, vehicle_capacity):
-    if len(path) == len(distance_matrix):
-        return path
+# Compute the range of loads [min_required_load, max_required_load] with which a vehicle can arrive
+# at each station, so that the request of the station can be served without the load of the vehicle
+# falling below 0 or exceeding its capacity.
+#
+# @return a pair of lists: (min_required_loads, max_required_loads), indexed by station
+def compute_required_loads(requests, vehicle_capacity):
+    min_required_loads = [ max(0, 0 - request) for request in requests ]
+    max_required_loads = [ min(vehicle_capacity, vehicle_capacity - request) for request in requests ]
 
-    # NOTE: this comment contains an alternative version of the code below
-    # # find reachable vertices
-    # reachable = []
-    # for index, request in enumerate(requests):
-    #     vertex = index + 1
-    #     min_required_load = max(0, 0 - request)
-    #     max_required_load = min(vehicle_capacity, vehicle_capacity - request)
-    #
-    #     move_allowed = (min_load >= min_required_load and min_load <= max_required_load) or (max_load >= min_required_load and max_load <= max_required_load)
-    #
-    #     if vertex not in path and move_allowed:
-    #         reachable.append(vertex)
-    #
-    # for vertex in reachable:
-    #     request = requests[vertex - 1]
-    #
-    #     min_required_load = max(0, 0 - request)
-    #     max_required_load = min(vehicle_capacity, vehicle_capacity - request)
-    #
-    #     # obtain the intersection of the two load ranges (available and required) as the new available range
-    #     new_min_load = max(min_load, min_required_load) + request
-    #     new_max_load = min(max_load, max_required_load) + request
-    #
-    #     final_path = depth_first_search(path + [vertex], distance_matrix, requests, new_min_load, new_max_load, vehicle_capacity)
-    #     if final_path is not None:
-    #         return final_path
-    #
-    # return None
-
-    for index, request in enumerate(requests):
-        vertex = index + 1
-        min_required_load = max(0, 0 - request)
-        max_required_load = min(vehicle_capacity, vehicle_capacity - request)
+    return min_required_loads, max_required_loads
+
+# Generate the integers 0, ..., size - 1 in a random order.
+#
+# The permutation is a Fisher-Yates shuffle done lazily, i.e. only the positions that were swapped are stored,
+# so drawing the first k integers costs O(k) regardless of the size. Used to walk a neighbourhood of
+# integer-encoded moves in a random order, where every move is evaluated exactly once.
+# The random numbers are drawn from the given generator (random.Random instance or the random module itself).
+def generate_random_permutation(size, rng = random):
+    swapped = {}
+
+    for position in range(0, size):
+        other_position = rng.randrange(position, size)
+
+        value = swapped.get(other_position, other_position)
+        swapped[other_position] = swapped.pop(position, position)
+
+        yield value
+
+# The largest integer whose square is at most the given non-negative integer (math.isqrt() of Python 3.8):
+# the floating-point square root corrected by one in either direction, where it is rounded off.
+def compute_integer_sqrt(value):
+    root = int( math.sqrt(value) )
+    while root * root > value:
+        root -= 1
+    while (root + 1) * (root + 1) <= value:
+        root += 1
+
+    return root
+
+# The given number of smallest and of largest values (all of them if there are fewer), both in ascending order.
+# Only the selected values are sorted, the array is partitioned around them in O(n).
+def select_extremes(values, count):
+    if count <= 0:
+        return values[ : 0 ], values[ : 0 ]
+
+    if 2 * count < len(values):
+        # NOTE: partitioning around a single position is considerably faster than around both at once
+        values = np.partition(values, count - 1)
+        rest = np.partition(values[count : ], len(values) - 2 * count)
+        return np.sort(values[ : count ]), np.sort(rest[len(rest) - count : ])
+
+    values = np.sort(values)
+    return values[ : count ], values[ max(0, len(values) - count) : ]
+
+# The sums of the given number of smallest and of largest entries of the distance matrix (including the diagonal).
+#
+# @return a pair: (sum of the smallest entries, sum of the largest entries)
+def compute_extreme_distance_sums(distance_matrix, count):
+    if isinstance(distance_matrix, PackedDistanceMatrix):
+        # the entries above the diagonal appear twice in the full matrix, so the extremes are selected
+        # from the extremes of the diagonal and of the (doubled) entries above it
+        diagonal, above_diagonal = distance_matrix.get_triangle_entries()
+        diagonal_smallest, diagonal_largest = select_extremes(diagonal, count)
+        above_smallest, above_largest = select_extremes(above_diagonal, count)
+
+        smallest, _ = select_extremes( np.concatenate( (diagonal_smallest, np.repeat(above_smallest, 2)) ), count )
+        _, largest = select_extremes( np.concatenate( (diagonal_largest, np.repeat(above_largest, 2)) ), count )
+    else:
+        smallest, largest = select_extremes( np.ravel(distance_matrix), count )
+
+    return float( smallest.sum() ), float( largest.sum() )
+
+# the number of initial loads tried by construct_greedy_path() (besides the middle one)
+GREEDY_INITIAL_LOADS_NUM = 9
 
-        move_allowed = (min_load >= min_required_load and min_load <= max_required_load) or (max_load >= min_required_load and max_load <= max_required_load)
+# Construct a path through all the stations that a vehicle starting with the given load can traverse, greedily
+# in O(n log n) comparisons: the next station is the largest pickup (positive request) or delivery (negative request)
+# that keeps the load of the vehicle within [0, capacity], whichever request is larger. The stations with no request
+# are left for the end, as they can be visited at any point.
+#
+# @return the path (starting with the depot, vertex 0) or None if the vehicle got stuck
+def construct_greedy_path_from_load(requests, vehicle_capacity, initial_load):
+    # the pickups and the deliveries in the ascending order of their requests
+    pickups = sorted( [ (request, index + 1) for index, request in enumerate(requests) if request > 0 ] )
+    deliveries = sorted( [ (request, index + 1) for index, request in enumerate(requests) if request < 0 ] )
+    pickup_requests = [ request for request, vertex in pickups ]
+    delivery_requests = [ request for request, vertex in deliveries ]
 
-        if vertex not in path and move_allowed:
-            # obtain the intersection of the two load ranges (available and required) as the new available range
-            new_min_load = max(min_load, min_required_load) + request
-            new_max_load = min(max_load, max_required_load) + request
+    path = [0]
+    load = initial_load
 
-            final_path = depth_first_search(path + [vertex], distance_matrix, requests, new_min_load, new_max_load, vehicle_capacity)
-            if final_path is not None:
-                return final_path
+    while len(pickups) > 0 or len(deliveries) > 0:
+        # the largest pickup that fits within the capacity and the largest delivery the load can serve
+        pickup_index = bisect.bisect_right(pickup_requests, vehicle_capacity - load) - 1
+        delivery_index = bisect.bisect_left(delivery_requests, -load)
+        has_pickup = pickup_index >= 0
+        has_delivery = delivery_index < len(deliveries)
+
+        if has_pickup and has_delivery:
+            is_pickup = pickup_requests[pickup_index] >= -delivery_requests[delivery_index]
+        elif has_pickup or has_delivery:
+            is_pickup = has_pickup
+        else:
+            return None
+
+        # NOTE: the removal from the middle of a list is a (fast) memory move, the search dominates the comparisons
+        if is_pickup:
+            request, vertex = pickups.pop(pickup_index)
+            del pickup_requests[pickup_index]
+        else:
+            request, vertex = deliveries.pop(delivery_index)
+            del delivery_requests[delivery_index]
+
+        load += request
+        path.append(vertex)
+
+    path += [ index + 1 for index, request in enumerate(requests) if request == 0 ]
+
+    return path
+
+# Construct a path through all the stations that a vehicle can traverse, greedily (see construct_greedy_path_from_load())
+# for a number of initial loads: the middle of the range of the loads with which the vehicle can both start and end
+# the path (the net request has to fit as well) first, then GREEDY_INITIAL_LOADS_NUM loads spread evenly over it.
+# NOTE: a feasible path does not always exist even if the net request fits within the capacity (e.g. the requests
+#       -2, 4, 4, -3 with capacity 4) and the greedy order does not find every one that exists, see construct_path()
+#
+# The vehicle can start with any load by default, the range of its initial loads can be narrowed down by
+# min_initial_load and max_initial_load (e.g. to complete a path, see construct_nearest_neighbour_path()).
+#
+# @return the path (starting with the depot, vertex 0) or None if the construction failed
+def construct_greedy_path(requests, vehicle_capacity, min_initial_load = 0, max_initial_load = None):
+    if max_initial_load is None:
+        max_initial_load = vehicle_capacity
+
+    net_request = sum(requests)
+    min_initial_load = max(min_initial_load, -net_request)
+    max_initial_load = min(max_initial_load, vehicle_capacity - net_request)
+    if min_initial_load > max_initial_load:
+        return None
+
+    initial_loads = [ (min_initial_load + max_initial_load) // 2 ]
+    for step in range(0, GREEDY_INITIAL_LOADS_NUM):
+        initial_load = min_initial_load + (max_initial_load - min_initial_load) * step // (GREEDY_INITIAL_LOADS_NUM - 1)
+        if initial_load not in initial_loads:
+            initial_loads.append(initial_load)
+
+    for initial_load in initial_loads:
+        path = construct_greedy_path_from_load(requests, vehicle_capacity, initial_load)
+        if path is not None:
+            return path
 
     return None
 
+# Construct a path through all the stations that a vehicle can traverse, starting from the depot and always moving
+# to the nearest station that the vehicle can visit next, i.e. that it can serve with one of the loads it can have
+# and after which the net request of the stations left still fits within the capacity. The candidates of each
+# step are found at once over the arrays of the stations, i.e. the construction takes O(n^2).
+# If the vehicle gets stuck, the rest of the path is completed by construct_greedy_path() from the loads
+# the vehicle can have at that point and, if that fails as well, the whole path is constructed by construct_path().
+#
+# @return the path (starting with the depot, vertex 0) or None if there is none
+def construct_nearest_neighbour_path(distance_matrix, requests, vehicle_capacity, min_required_loads = None, max_required_loads = None):
+    if min_required_loads is None:
+        min_required_loads, max_required_loads = compute_required_loads(requests, vehicle_capacity)
 
-def compute_assignment_cost(assignments, requests, vehicle_num, vehicle_capacity):
-    # compute the net request for each group of stations
+    station_requests = np.asarray(requests, dtype = np.int64)
+    station_min_required_loads = np.asarray(min_required_loads, dtype = np.int64)
+    station_max_required_loads = np.asarray(max_required_loads, dtype = np.int64)
+    unvisited = np.ones(len(requests), dtype = bool)
+
+    path = [0]
+    min_load = 0
+    max_load = vehicle_capacity
+    remaining_request = int( station_requests.sum() )
+
+    while len(path) <= len(requests):
+        # the range of loads after each station and the net request of the stations left after it
+        new_min_loads = np.maximum(min_load, station_min_required_loads) + station_requests
+        new_max_loads = np.minimum(max_load, station_max_required_loads) + station_requests
+        left_requests = remaining_request - station_requests
+
+        candidates = unvisited & (new_min_loads <= new_max_loads) & (np.maximum(new_min_loads, -left_requests) <= np.minimum(new_max_loads, vehicle_capacity - left_requests))
+        if not candidates.any():
+            break
+
+        # NOTE: the row of the distance matrix includes the depot (vertex 0), the stations are numbered from 1
+        distances = np.asarray(distance_matrix[ path[-1] ], dtype = np.float64)[1:]
+        station = int( np.argmin( np.where(candidates, distances, np.inf) ) )
+
+        unvisited[station] = False
+        min_load = int( new_min_loads[station] )
+        max_load = int( new_max_loads[station] )
+        remaining_request = int( left_requests[station] )
+        path.append(station + 1)
+
+    if len(path) == len(requests) + 1:
+        return path
+
+    # complete the path from the loads the vehicle can have
+    remaining_stations = np.flatnonzero(unvisited)
+    completion = construct_greedy_path([ requests[station] for station in remaining_stations ], vehicle_capacity, min_load, max_load)
+    if completion is not None:
+        return path + [ int(remaining_stations[vertex - 1]) + 1 for vertex in completion[1:] ]
+
+    return construct_path(distance_matrix, requests, vehicle_capacity, min_required_loads, max_required_loads)
+
+# Construct the paths of (at most) vehicle_num vehicles by the savings heuristic of Clarke and Wright: every station
+# starts on a route of its own (from the depot and back) and the routes are merged in the decreasing order of the savings
+#   s(i, j) = d(i, 0) + d(0, j) - d(i, j)
+# of visiting the station j right after the station i, where i is the last station of one route and j the first
+# of another, as long as the vehicle can traverse the merged route, i.e. its load window is not empty (the load
+# windows of the routes are composed in O(1), see PathLoadWindows). All the positive savings are applied and
+# the routes are merged further (with the smallest losses) only while there are more routes than vehicles.
+#
+# The distance matrix is symmetric, so the savings of (i, j) and (j, i) are equal: they are computed once per pair
+# of stations, row by row from the upper triangle in the dtype of the matrix (see the distance options of Problem),
+# and both orders are tried. The savings take half the memory of a square matrix of that dtype and their order half
+# the memory of a float64 square matrix; the distance matrix itself is never expanded.
+#
+# @return list of vehicle_num paths (starting with the depot, vertex 0, the unused ones are just [0])
+#         or None if the stations could not be merged into vehicle_num routes
+def construct_savings_paths(distance_matrix, requests, vehicle_num, vehicle_capacity, min_required_loads = None, max_required_loads = None):
+    if min_required_loads is None:
+        min_required_loads, max_required_loads = compute_required_loads(requests, vehicle_capacity)
+
+    stations_num = len(requests)
+
+    # the savings of the pairs of stations (i, j), i < j, in the order of the rows of the upper triangle
+    # NOTE: the row of the distance matrix includes the depot (vertex 0), the stations are numbered from 1
+    depot_distances = np.asarray(distance_matrix[0])[1:]
+    row_starts = [ 0 for station in range(0, stations_num + 1) ]
+    savings = np.empty(stations_num * (stations_num - 1) // 2, dtype = depot_distances.dtype)
+    for station in range(0, stations_num):
+        row_starts[station + 1] = row_starts[station] + stations_num - station - 1
+        savings[ row_starts[station] : row_starts[station + 1] ] = (depot_distances[station] + depot_distances[station + 1:]
+            - distance_matrix[station + 1, np.arange(station + 2, stations_num + 1)])
+
+    # the pairs in the decreasing order of their savings
+    order = np.argsort(savings, kind = "stable")[::-1]
+
+    # the stations of each route, the route of each station and the summary of the loads of each route
+    routes = [ [ station ] for station in range(0, stations_num) ]
+    station_routes = list( range(0, stations_num) )
+    summaries = [ (min_required_loads[station], max_required_loads[station], requests[station]) for station in range(0, stations_num) ]
+    routes_num = stations_num
+
+    depot = (0, vehicle_capacity, 0)
+    for index in order.tolist():
+        if routes_num <= vehicle_num and savings[index] <= 0:
+            break
+
+        station_1 = bisect.bisect_right(row_starts, index) - 1
+        station_2 = station_1 + 1 + index - row_starts[station_1]
+        route_1 = station_routes[station_1]
+        route_2 = station_routes[station_2]
+        if route_1 == route_2:
+            continue
+
+        # the end of one route followed by the start of the other, in either order
+        summary = None
+        for first_station, second_station in ( (station_2, station_1), (station_1, station_2) ):
+            first_route = station_routes[first_station]
+            second_route = station_routes[second_station]
+            if routes[first_route][-1] == first_station and routes[second_route][0] == second_station:
+                summary = PathLoadWindows.compose(summaries[first_route], summaries[second_route])
+                if PathLoadWindows.is_feasible( PathLoadWindows.compose(depot, summary) ):
+                    route_1, route_2 = first_route, second_route
+                    break
+                summary = None
+
+        if summary is None:
+            continue
+
+        # the merged route keeps the index of the longer one, so that every station is moved O(log n) times
+        merged_route, removed_route = (route_1, route_2) if len(routes[route_1]) >= len(routes[route_2]) else (route_2, route_1)
+        for station in routes[removed_route]:
+            station_routes[station] = merged_route
+
+        routes[merged_route] = routes[route_1] + routes[route_2]
+        routes[removed_route] = None
+        summaries[merged_route] = summary
+        routes_num -= 1
+
+    if routes_num > vehicle_num:
+        return None
+
+    vehicle_paths = [ [0] + [ station + 1 for station in route ] for route in routes if route is not None ]
+
+    return vehicle_paths + [ [0] for vehicle in range(routes_num, vehicle_num) ]
+
+# The ways of constructing the initial path of a vehicle:
+#   greedy  - construct_greedy_path(), which ignores the distances, with the exhaustive search as the fallback
+#   nearest - construct_nearest_neighbour_path(), which follows the distances as far as the loads allow
+#   dfs     - the exhaustive depth_first_search() only, which ignores the distances and can take exponential time
+#             (up to DEPTH_FIRST_SEARCH_MAX_NODES)
+CONSTRUCTIONS = ("greedy", "nearest", "dfs")
+
+# the maximum number of vertices the depth-first search appends to the path before it gives up, see depth_first_search()
+DEPTH_FIRST_SEARCH_MAX_NODES = 100000
+
+# Construct a path through all the stations that a vehicle can traverse in the given way, see CONSTRUCTIONS.
+# There is no path if the net request of the stations does not fit within the capacity (the vehicle cannot both
+# start and end with a load in [0, capacity]), which is checked first.
+#
+# @return the path (starting with the depot, vertex 0) or None if there is none (or the search gave up)
+def construct_path(distance_matrix, requests, vehicle_capacity, min_required_loads = None, max_required_loads = None, construction = "greedy"):
+    if construction not in CONSTRUCTIONS:
+        raise ValueError("Unknown construction: " + str(construction) + " (available: " + ", ".join(CONSTRUCTIONS) + ")")
+
+    if abs( sum(requests) ) > vehicle_capacity:
+        return None
+
+    if construction == "nearest":
+        return construct_nearest_neighbour_path(distance_matrix, requests, vehicle_capacity, min_required_loads, max_required_loads)
+    elif construction == "greedy":
+        path = construct_greedy_path(requests, vehicle_capacity)
+        if path is not None:
+            return path
+
+    return depth_first_search([0], distance_matrix, requests, 0, vehicle_capacity, vehicle_capacity, min_required_loads, max_required_loads)
+
+# Find a path through all the vertices (extending the given one) that a vehicle can traverse, by backtracking.
+# The vertices are tried in the order of their indices, the range of loads with which the vehicle can arrive
+# at the next vertex is [min_load, max_load]. The search keeps an explicit stack instead of recursing, so
+# it is not limited by the recursion depth, and marks the vertices on the path in a bitset.
+# NOTE: it takes exponential time in the worst case (e.g. if there is no feasible path), so it gives up
+#       after max_nodes vertices appended to the path (None for no limit), see construct_path()
+#
+# @return the path or None if there is none (or the search gave up)
+def depth_first_search(path, distance_matrix, requests, min_load, max_load, vehicle_capacity, min_required_loads = None, max_required_loads = None,
+        max_nodes = DEPTH_FIRST_SEARCH_MAX_NODES):
+    if min_required_loads is None:
+        min_required_loads, max_required_loads = compute_required_loads(requests, vehicle_capacity)
+
+    vertices_num = len(distance_matrix)
+    path = list(path)
+
+    visited = bytearray(vertices_num)
+    for vertex in path:
+        visited[vertex] = 1
+
+    # for each vertex appended to the path: the range of loads after it and the next station to try after it
+    stack = [ [min_load, max_load, 0] ]
+    nodes = 0
+
+    while len(path) < vertices_num:
+        min_load, max_load, index = stack[-1]
+
+        # find the next station that can be visited
+        while index < len(requests):
+            min_required_load = min_required_loads[index]
+            max_required_load = max_required_loads[index]
+
+            move_allowed = (min_load >= min_required_load and min_load <= max_required_load) or (max_load >= min_required_load and max_load <= max_required_load)
+
+            if not visited[index + 1] and move_allowed:
+                break
+
+            index += 1
+
+        if index == len(requests):
+            # no station can follow the path, backtrack
+            stack.pop()
+            if len(stack) == 0:
+                return None
+
+            visited[path.pop()] = 0
+            continue
+
+        stack[-1][2] = index + 1
+
+        nodes += 1
+        if max_nodes is not None and nodes > max_nodes:
+            return None
+
+        # obtain the intersection of the two load ranges (available and required) as the new available range
+        request = requests[index]
+        new_min_load = max(min_load, min_required_loads[index]) + request
+        new_max_load = min(max_load, max_required_loads[index]) + request
+
+        vertex = index + 1
+        path.append(vertex)
+        visited[vertex] = 1
+        stack.append( [new_min_load, new_max_load, 0] )
+
+    return path
+
+
+# the outstanding request of a group of stations with the given net request, i.e.
+#    abs(net_request) - vehicle_capacity,  if net_request not in [-vehicle_capacity, vehicle_capacity]
+#    0 otherwise
+def compute_outstanding_request(net_request, vehicle_capacity):
+    return max(0, abs(net_request) - vehicle_capacity)
+
+# compute the net request for each group of stations
+def compute_net_requests(assignments, requests, vehicle_num):
     net_requests = [ 0 for i in range(0, vehicle_num) ]
     for station, vehicle in enumerate(assignments):
         net_requests[vehicle] += requests[station]
 
+    return net_requests
+
+def compute_assignment_cost(assignments, requests, vehicle_num, vehicle_capacity):
+    net_requests = compute_net_requests(assignments, requests, vehicle_num)
+
     # compute the cost as the sum of outstanding requests for each vehicle
-    # an outstanding request if defined as:
-    #    abs(net_request) - vehicle_capacity,  if net_request not in [-vehicle_capacity, vehicle_capacity]
-    #    0 otherwise
-    cost = sum( [ max(0, abs(net_r) - vehicle_capacity) for net_r in net_requests ] )
-    # cost = sum( [ abs(net_r) - vehicle_capacity for net_r in net_requests ] )
+    cost = sum( [ compute_outstanding_request(net_r, vehicle_capacity) for net_r in net_requests ] )
 
     return cost
 
@@ -87,46 +437,287 @@ def generate_initial_assignments(requests, vehicle_num):
 
     return assignments
 
-def generate_neighbour_assignment(assignments, vehicle_num):
-    new_assignments = assignments.copy()    # we do not want to modify the original solution
+# Choose a random station to be reassigned and a random different vehicle to reassign it to.
+# NOTE: draws the same random numbers as choosing from the list of (station, vehicle) pairs, without building it
+#
+# @return a pair: (station, new vehicle)
+def generate_neighbour_move(assignments, vehicle_num, rng = random):
+    station = rng.randrange( len(assignments) )
+    new_vehicle = ( assignments[station] + rng.randint(1, vehicle_num - 1) ) % vehicle_num
 
-    # choose a random station to be reassigned
-    station, current_vehicle = random.choice( list(enumerate(assignments)) )
+    return station, new_vehicle
 
-    # reassign the station to a random different vehicle
-    new_assignments[station] = ( current_vehicle + random.randint(1, vehicle_num - 1) ) % vehicle_num
+# the seed of the Zobrist keys, which only have to be (pseudo-)random and are the same for every search
+ZOBRIST_SEED = 0
 
-    return new_assignments
+# The Zobrist keys of the assignments: a random 64-bit key for each pair (station, vehicle). The hash of
+# an assignment of all the stations is the XOR of the keys of its pairs, so reassigning a station changes
+# the hash in O(1): hash ^ keys[station][old vehicle] ^ keys[station][new vehicle].
+#
+# @return list of lists of ints, indexed by station and vehicle
+def generate_zobrist_keys(stations_num, vehicle_num):
+    keys = np.random.default_rng(ZOBRIST_SEED).integers(0, 2 ** 64, size = (stations_num, vehicle_num), dtype = np.uint64)
 
-def tabu_search(requests, vehicle_num, vehicle_capacity):
+    return keys.tolist()
+
+# Assign the stations to the vehicles, so that the net request of the stations of every vehicle is within
+# [-vehicle_capacity, vehicle_capacity], by a tabu search over the reassignments of single stations.
+#
+# The net requests of the vehicles are kept up to date, so that a reassignment is scored in O(1), and the tabu
+# list holds the Zobrist hashes (see generate_zobrist_keys()) of the last stations_num assignments visited, in
+# a deque (the order in which they leave the list) and a set (the membership tests), i.e. an iteration takes O(1).
+#
+# The search starts from the given assignments (which are not modified) or from generate_initial_assignments().
+#
+# @return list with the vehicle of each station or None if no valid assignment was found
+def tabu_search(requests, vehicle_num, vehicle_capacity, rng = random, assignments = None):
     # assignments = [ random.randint(0, vehicle_num - 1) for i in range(0, len(requests)) ]
-    assignments = generate_initial_assignments(requests, vehicle_num)
-    cost = compute_assignment_cost(assignments, requests, vehicle_num, vehicle_capacity)
+    if assignments is None:
+        assignments = generate_initial_assignments(requests, vehicle_num)
+    else:
+        assignments = list(assignments)
+    net_requests = compute_net_requests(assignments, requests, vehicle_num)
+    cost = sum( [ compute_outstanding_request(net_r, vehicle_capacity) for net_r in net_requests ] )
 
     stations_num = len(requests)
-    visited = []
-    visited_size_limit = stations_num
+    zobrist_keys = generate_zobrist_keys(stations_num, vehicle_num)
+    assignment_hash = 0
+    for station, vehicle in enumerate(assignments):
+        assignment_hash ^= zobrist_keys[station][vehicle]
 
+    visited = deque()
+    visited_hashes = set()
     # define the max number of iterations
     neighbourhood_size = stations_num * vehicle_num
+
+    # NOTE: the tabu list is shorter than the number of neighbours of an assignment (stations_num * (vehicle_num - 1)),
+    #       otherwise all the neighbours of the current one can be tabu and the search never ends (e.g. with 2 vehicles)
+    visited_size_limit = min(stations_num, neighbourhood_size - stations_num - 1)
     max_iterations = 2 * neighbourhood_size
     iter = 0
 
-    # perform the search
-    while cost > 0 and iter < max_iterations:
-        new_assignments = generate_neighbour_assignment(assignments, vehicle_num)
-        new_cost = compute_assignment_cost(new_assignments, requests, vehicle_num, vehicle_capacity)
-        if str(new_assignments) not in visited:
+    # perform the search (a single vehicle has no neighbours)
+    while cost > 0 and iter < max_iterations and vehicle_num > 1:
+        station, new_vehicle = generate_neighbour_move(assignments, vehicle_num, rng)
+        vehicle = assignments[station]
+        request = requests[station]
+
+        new_hash = assignment_hash ^ zobrist_keys[station][vehicle] ^ zobrist_keys[station][new_vehicle]
+        if new_hash not in visited_hashes:
+            # only the outstanding requests of the two vehicles change
+            new_cost = (cost - compute_outstanding_request(net_requests[vehicle], vehicle_capacity) - compute_outstanding_request(net_requests[new_vehicle], vehicle_capacity)
+                + compute_outstanding_request(net_requests[vehicle] - request, vehicle_capacity) + compute_outstanding_request(net_requests[new_vehicle] + request, vehicle_capacity))
+
             if new_cost <= cost:
-                assignments = new_assignments
+                assignments[station] = new_vehicle
+                net_requests[vehicle] -= request
+                net_requests[new_vehicle] += request
+                assignment_hash = new_hash
                 cost = new_cost
             iter += 1
-            visited.append( str(new_assignments) )
+            visited.append(new_hash)
+            visited_hashes.add(new_hash)
             if len(visited) > visited_size_limit:
-                visited.pop(0)
+                visited_hashes.discard( visited.popleft() )
 
     # return the solution if a valid one was found
     if cost <= 0:
         return assignments
     else:
         return None
+
+
+# Assign the stations to the vehicles by the differencing method of Karmarkar and Karp, generalised to vehicle_num
+# groups: every station is a partial partition into vehicle_num groups (the station alone in one of them), and the
+# two partial partitions with the largest spread of the net requests of their groups (the largest minus the smallest)
+# are repeatedly combined into one, pairing the group with the largest net request of one with the group with the
+# smallest net request of the other, and so on. The spreads cancel each other out, i.e. the groups of the last
+# partition have (nearly) equal net requests.
+#
+# The stations of the groups are kept as linked lists, so that a combination is a few numpy operations
+# over the vehicle_num groups, i.e. it takes O(n log n) operations for n stations.
+#
+# The partial partitions with the same spread (e.g. the stations with the same request) are combined in the order
+# of their indices or, if a random number generator is given, in a random order drawn from it, so that different
+# generators put different stations together (with equally balanced groups).
+#
+# @return list with the vehicle of each station
+def compute_differencing_assignments(requests, vehicle_num, rng = None):
+    stations_num = len(requests)
+
+    # the key that breaks the ties of the spreads of the partial partitions (the one of their first station)
+    tie_keys = list( range(0, stations_num) )
+    if rng is not None:
+        rng.shuffle(tie_keys)
+
+    # the stations of a group are a linked list from its first station: the next station of each station
+    # (-1 at the end of the list) and the last station of the list starting at each station
+    next_stations = np.full(stations_num, -1, dtype = np.intp)
+    last_stations = np.arange(0, stations_num, dtype = np.intp)
+
+    # the partial partitions as (-spread, tie key, net requests of the groups, first stations of the groups or -1),
+    # where the groups are in the decreasing order of their net requests
+    heap = []
+    for station, request in enumerate(requests):
+        net_requests = np.zeros(vehicle_num, dtype = np.int64)
+        first_stations = np.full(vehicle_num, -1, dtype = np.intp)
+        group = 0 if request >= 0 else vehicle_num - 1
+        net_requests[group] = request
+        first_stations[group] = station
+        heap.append( (-abs(request), tie_keys[station], net_requests, first_stations) )
+    heapq.heapify(heap)
+
+    while len(heap) > 1:
+        _, tie_key, net_requests_1, first_stations_1 = heapq.heappop(heap)
+        _, _, net_requests_2, first_stations_2 = heapq.heappop(heap)
+
+        # the largest group of one partition with the smallest of the other
+        net_requests = net_requests_1 + net_requests_2[::-1]
+        first_stations_2 = first_stations_2[::-1]
+
+        # append the list of the group of the second partition to the one of the first (if neither is empty)
+        both = (first_stations_1 >= 0) & (first_stations_2 >= 0)
+        next_stations[ last_stations[ first_stations_1[both] ] ] = first_stations_2[both]
+        last_stations[ first_stations_1[both] ] = last_stations[ first_stations_2[both] ]
+        first_stations = np.where(first_stations_1 >= 0, first_stations_1, first_stations_2)
+
+        order = np.argsort(-net_requests, kind = "stable")
+        net_requests = net_requests[order]
+        heapq.heappush(heap, (-int(net_requests[0] - net_requests[-1]), tie_key, net_requests, first_stations[order]))
+
+    assignments = [ 0 for station in range(0, stations_num) ]
+    if len(heap) > 0:
+        next_stations = next_stations.tolist()
+        for vehicle, station in enumerate(heap[0][3].tolist()):
+            while station >= 0:
+                assignments[station] = vehicle
+                station = next_stations[station]
+
+    return assignments
+
+# the maximum number of (partial) assignments the complete search tries before it gives up, see search_assignments(),
+# and the number of stations up to which it is tried by assign_stations()
+COMPLETE_SEARCH_MAX_NODES = 100000
+COMPLETE_SEARCH_MAX_STATIONS = 100
+
+# Find an assignment of the stations to the vehicles in which the net request of every vehicle is within
+# [-vehicle_capacity, vehicle_capacity] by a complete (depth-first) search. The stations are assigned in the decreasing
+# order of the magnitudes of their requests, each to the vehicles in which its request brings the net request closest
+# to 0 first, and the vehicles with the same net request are tried only once (e.g. the empty ones). A partial assignment
+# is abandoned if the net requests of its vehicles exceed the capacity by more than the remaining requests can offset.
+# The search is iterative and gives up after max_nodes partial assignments, i.e. it is complete for small instances only.
+#
+# @return list with the vehicle of each station or None if no valid assignment was found
+def search_assignments(requests, vehicle_num, vehicle_capacity, max_nodes = COMPLETE_SEARCH_MAX_NODES):
+    stations_num = len(requests)
+    if stations_num == 0:
+        return []
+
+    order = sorted(range(0, stations_num), key = lambda station: -abs(requests[station]))
+    ordered_requests = [ requests[station] for station in order ]
+
+    # the sum of the positive and of the negative requests from each position onwards
+    remaining_positive = [ 0 for position in range(0, stations_num + 1) ]
+    remaining_negative = [ 0 for position in range(0, stations_num + 1) ]
+    for position in range(stations_num - 1, -1, -1):
+        request = ordered_requests[position]
+        remaining_positive[position] = remaining_positive[position + 1] + max(0, request)
+        remaining_negative[position] = remaining_negative[position + 1] + min(0, request)
+
+    # the net request of each vehicle and the sums of the net requests above the capacity and below its negative
+    net_requests = [ 0 for vehicle in range(0, vehicle_num) ]
+    excess = 0
+    deficit = 0
+
+    # the change of the excess and the deficit when the net request of a vehicle changes by the request
+    def get_changes(net_request, request):
+        new_net_request = net_request + request
+        return (max(0, new_net_request - vehicle_capacity) - max(0, net_request - vehicle_capacity),
+            max(0, -vehicle_capacity - new_net_request) - max(0, -vehicle_capacity - net_request))
+
+    # the vehicles to try for the station at the given position, as described above
+    def get_candidates(position):
+        request = ordered_requests[position]
+        candidates = {}
+        for vehicle, net_request in enumerate(net_requests):
+            candidates.setdefault(net_request, vehicle)
+
+        return sorted(candidates.values(), key = lambda vehicle: abs(net_requests[vehicle] + request))
+
+    # one frame per assigned position: [the candidate vehicles, the index of the next one to try]
+    stack = [ [ get_candidates(0), 0 ] ]
+    nodes = 0
+    while len(stack) > 0:
+        position = len(stack) - 1
+        frame = stack[-1]
+        candidates = frame[0]
+
+        # undo the previous assignment of the station
+        if frame[1] > 0:
+            previous_vehicle = candidates[ frame[1] - 1 ]
+            excess_change, deficit_change = get_changes(net_requests[previous_vehicle], -ordered_requests[position])
+            net_requests[previous_vehicle] -= ordered_requests[position]
+            excess += excess_change
+            deficit += deficit_change
+
+        if frame[1] == len(candidates):
+            stack.pop()
+            continue
+
+        vehicle = candidates[ frame[1] ]
+        frame[1] += 1
+        excess_change, deficit_change = get_changes(net_requests[vehicle], ordered_requests[position])
+        net_requests[vehicle] += ordered_requests[position]
+        excess += excess_change
+        deficit += deficit_change
+
+        nodes += 1
+        if nodes > max_nodes:
+            return None
+
+        # the requests above the capacity (and below its negative) have to be offset by the remaining stations
+        if excess > -remaining_negative[position + 1] or deficit > remaining_positive[position + 1]:
+            continue
+
+        if position + 1 == stations_num:
+            assignments = [ 0 for station in range(0, stations_num) ]
+            for assigned_position, assigned_frame in enumerate(stack):
+                assignments[ order[assigned_position] ] = assigned_frame[0][ assigned_frame[1] - 1 ]
+            return assignments
+
+        stack.append( [ get_candidates(position + 1), 0 ] )
+
+    return None
+
+# The ways of assigning the stations to the vehicles:
+#   differencing - compute_differencing_assignments(), then (if the net request of a vehicle is still out of its capacity)
+#                  the bounded complete search_assignments() for small instances and finally the tabu_search()
+#                  from the differencing assignments; the ties of the differencing are broken by the random number
+#                  generator of the problem, so that every chain (or replica) of the search starts from its own assignment
+#   tabu         - the tabu_search() only
+ASSIGNMENTS = ("differencing", "tabu")
+
+# Assign the stations to the vehicles, so that the net request of the stations of every vehicle is within
+# [-vehicle_capacity, vehicle_capacity], in the given way, see ASSIGNMENTS.
+#
+# @return list with the vehicle of each station or None if no valid assignment was found
+def assign_stations(requests, vehicle_num, vehicle_capacity, rng = random, assignment = "differencing"):
+    if assignment == "tabu":
+        return tabu_search(requests, vehicle_num, vehicle_capacity, rng)
+    elif assignment != "differencing":
+        raise ValueError("Unknown assignment: " + str(assignment) + " (available: " + ", ".join(ASSIGNMENTS) + ")")
+
+    # the net request of some vehicle is out of its capacity whatever the assignment
+    if abs(sum(requests)) > vehicle_num * vehicle_capacity:
+        return None
+
+    assignments = compute_differencing_assignments(requests, vehicle_num, rng)
+    if compute_assignment_cost(assignments, requests, vehicle_num, vehicle_capacity) <= 0:
+        return assignments
+
+    if len(requests) <= COMPLETE_SEARCH_MAX_STATIONS:
+        searched_assignments = search_assignments(requests, vehicle_num, vehicle_capacity)
+        if searched_assignments is not None:
+            return searched_assignments
+
+    return tabu_search(requests, vehicle_num, vehicle_capacity, rng, assignments)
@@ -1 +1 @@
-from .solver import solve, algorithms
+from .solver import solve, algorithms, default_options, option_values
@@ -1,7 +1,154 @@
+import numpy as np
 import geopy.distance
 
 
-def compute_distance_matrix(coordinates):
+# WGS-84 ellipsoid parameters (the same ellipsoid geopy uses by default)
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+
+# mean radius of the Earth (IUGG), used by the spherical approximations
+MEAN_EARTH_RADIUS = 6371008.8
+
+# The available ways of computing the distance between two points.
+#
+#   geodesic        - Vincenty's inverse formula on the WGS-84 ellipsoid, evaluated for all pairs at once;
+#                     agrees with geopy to within 0.1 mm for any two points that are not nearly antipodal
+#                     (the few pairs for which the iteration does not converge are handed over to geopy)
+#   haversine       - great-circle distance on a sphere of radius MEAN_EARTH_RADIUS;
+#                     within 0.6% of geopy for any two points (within 0.35% at London's latitude)
+#   equirectangular - flat projection around the mean latitude of each pair, then the same sphere;
+#                     adds less than 0.01% to the haversine error for points up to 50 km apart,
+#                     but should not be used for distances of more than a few hundred kilometres
+#   geopy           - one geopy.distance.geodesic() call per pair; the reference backend, slow
+DISTANCE_MODES = ("geodesic", "haversine", "equirectangular", "geopy")
+
+
+def compute_vincenty_distances(lat_1, lon_1, lat_2, lon_2, max_iterations = 200, tolerance = 1e-12):
+    lat_1, lon_1, lat_2, lon_2 = np.radians(lat_1), np.radians(lon_1), np.radians(lat_2), np.radians(lon_2)
+
+    # reduced latitudes
+    U_1 = np.arctan( (1 - WGS84_F) * np.tan(lat_1) )
+    U_2 = np.arctan( (1 - WGS84_F) * np.tan(lat_2) )
+    sin_U_1, cos_U_1 = np.sin(U_1), np.cos(U_1)
+    sin_U_2, cos_U_2 = np.sin(U_2), np.cos(U_2)
+
+    L = lon_2 - lon_1
+    lam = L.copy()
+
+    # iterate until the longitude on the auxiliary sphere converges for every pair
+    converged = np.zeros(L.shape, dtype = bool)
+    for iteration in range(0, max_iterations):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+
+        sin_sigma = np.hypot( cos_U_2 * sin_lam, cos_U_1 * sin_U_2 - sin_U_1 * cos_U_2 * cos_lam )
+        cos_sigma = sin_U_1 * sin_U_2 + cos_U_1 * cos_U_2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+
+        # coincident points have sin_sigma == 0, their distance is 0 regardless of the other terms
+        coincident = sin_sigma == 0
+        safe_sin_sigma = np.where(coincident, 1, sin_sigma)
+
+        sin_alpha = cos_U_1 * cos_U_2 * sin_lam / safe_sin_sigma
+        cos_sq_alpha = 1 - sin_alpha ** 2
+
+        # points on the equator have cos_sq_alpha == 0
+        equatorial = cos_sq_alpha == 0
+        cos_2_sigma_m = np.where(equatorial, 0, cos_sigma - 2 * sin_U_1 * sin_U_2 / np.where(equatorial, 1, cos_sq_alpha))
+
+        C = WGS84_F / 16 * cos_sq_alpha * (4 + WGS84_F * (4 - 3 * cos_sq_alpha))
+
+        previous_lam = lam
+        lam = L + (1 - C) * WGS84_F * sin_alpha * (sigma + C * sin_sigma * (cos_2_sigma_m + C * cos_sigma * (-1 + 2 * cos_2_sigma_m ** 2)))
+
+        converged = np.abs(lam - previous_lam) <= tolerance
+        if converged.all():
+            break
+
+    u_sq = cos_sq_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    B = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = B * sin_sigma * (cos_2_sigma_m + B / 4 * (cos_sigma * (-1 + 2 * cos_2_sigma_m ** 2)
+        - B / 6 * cos_2_sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2_sigma_m ** 2)))
+
+    distances = WGS84_B * A * (sigma - delta_sigma)
+    distances[coincident] = 0
+
+    return distances, converged
+
+
+def compute_haversine_distances(lat_1, lon_1, lat_2, lon_2):
+    lat_1, lon_1, lat_2, lon_2 = np.radians(lat_1), np.radians(lon_1), np.radians(lat_2), np.radians(lon_2)
+
+    h = np.sin( (lat_2 - lat_1) / 2 ) ** 2 + np.cos(lat_1) * np.cos(lat_2) * np.sin( (lon_2 - lon_1) / 2 ) ** 2
+
+    return 2 * MEAN_EARTH_RADIUS * np.arcsin( np.sqrt( np.minimum(h, 1) ) )
+
+
+def compute_equirectangular_distances(lat_1, lon_1, lat_2, lon_2):
+    lat_1, lon_1, lat_2, lon_2 = np.radians(lat_1), np.radians(lon_1), np.radians(lat_2), np.radians(lon_2)
+
+    x = (lon_2 - lon_1) * np.cos( (lat_1 + lat_2) / 2 )
+    y = lat_2 - lat_1
+
+    return MEAN_EARTH_RADIUS * np.hypot(x, y)
+
+
+def compute_geopy_distances(lat_1, lon_1, lat_2, lon_2):
+    return np.array([ geopy.distance.geodesic( (a, b), (c, d) ).m for a, b, c, d in zip(lat_1, lon_1, lat_2, lon_2) ], dtype = float)
+
+
+# Compute the distances (in meters) between the pairs of points given as four equally long
+# arrays of latitudes and longitudes (in degrees), i.e. the distance between the points
+# (lat_1[k], lon_1[k]) and (lat_2[k], lon_2[k]) for every k.
+def compute_pairwise_distances(lat_1, lon_1, lat_2, lon_2, mode = "geodesic"):
+    lat_1, lon_1 = np.asarray(lat_1, dtype = float), np.asarray(lon_1, dtype = float)
+    lat_2, lon_2 = np.asarray(lat_2, dtype = float), np.asarray(lon_2, dtype = float)
+
+    if mode == "geodesic":
+        distances, converged = compute_vincenty_distances(lat_1, lon_1, lat_2, lon_2)
+
+        # fall back to geopy for the (nearly antipodal) pairs for which the iteration did not converge
+        if not converged.all():
+            diverged = ~converged
+            distances[diverged] = compute_geopy_distances(lat_1[diverged], lon_1[diverged], lat_2[diverged], lon_2[diverged])
+
+        return distances
+    elif mode == "haversine":
+        return compute_haversine_distances(lat_1, lon_1, lat_2, lon_2)
+    elif mode == "equirectangular":
+        return compute_equirectangular_distances(lat_1, lon_1, lat_2, lon_2)
+    elif mode == "geopy":
+        return compute_geopy_distances(lat_1, lon_1, lat_2, lon_2)
+
+    raise ValueError("Unknown distance mode: " + str(mode) + " (available: " + ", ".join(DISTANCE_MODES) + ")")
+
+
+# Compute the symmetric matrix of distances (in meters) between every two points in the list
+# of (latitude, longitude) coordinates. Only the upper triangle is computed, in a single batch,
+# and then mirrored.
+#
+# @return a (n x n) numpy array of distances, where n is the number of coordinates
+def compute_distance_matrix(coordinates, mode = "geodesic"):
+    matrix_size = len(coordinates)
+    distance_matrix = np.zeros( (matrix_size, matrix_size) )
+    if matrix_size < 2:
+        return distance_matrix
+
+    coordinates = np.asarray(coordinates, dtype = float)
+    rows, cols = np.triu_indices(matrix_size, k = 1)
+
+    distances = compute_pairwise_distances(coordinates[rows, 0], coordinates[rows, 1], coordinates[cols, 0], coordinates[cols, 1], mode)
+
+    distance_matrix[rows, cols] = distances
+    distance_matrix[cols, rows] = distances
+
+    return distance_matrix
+
+
+# The original implementation with one geopy call per pair of points.
+# NOTE: kept as the reference for validating the vectorised modes, it is far too slow for the full network
+def compute_distance_matrix_geopy(coordinates):
     matrix_size = len(coordinates)
     distance_matrix = [ [ 0 for col in range(0, matrix_size) ] for row in range(0, matrix_size) ]
 
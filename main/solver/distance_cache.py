@@ -0,0 +1,122 @@
+import os
+import glob
+import hashlib
+import numpy as np
+from algorithms import write_file_atomically
+from .distance import compute_distance_matrix, compute_pairwise_distances
+
+
+# The cache is a directory with two files per entry:
+#   <mode>-<key>.npy               - the distance matrix, opened memory-mapped (read-only) on a hit
+#   <mode>-<key>.coordinates.npy   - the ordered coordinates the matrix was computed for, used to
+#                                    reuse the matching part of an entry when the coordinates change
+# where <key> is the hash of the ordered coordinates and the distance mode.
+
+def compute_cache_key(coordinates, mode):
+    coordinates = np.ascontiguousarray(coordinates, dtype = np.float64)
+
+    key = hashlib.sha256()
+    key.update(mode.encode())
+    key.update(str(coordinates.shape).encode())
+    key.update(coordinates.tobytes())
+
+    return key.hexdigest()
+
+
+def get_entry_paths(cache_dir, mode, key):
+    prefix = os.path.join(cache_dir, mode + "-" + key)
+    return prefix + ".npy", prefix + ".coordinates.npy"
+
+
+# Write the array to the given path atomically, so that concurrent solver processes
+# never open a partially written entry.
+def save_array(path, array):
+    write_file_atomically(path, lambda file: np.save(file, array), binary = True)
+
+
+# Find the cached entry (computed with the same mode) that shares the most points with the
+# given coordinates.
+#
+# @return a pair: (path of the matrix file, index in the cached entry of each given point or -1 if missing)
+#         or None if no entry shares at least two points
+def find_overlapping_entry(cache_dir, mode, coordinates):
+    best_path = None
+    best_indices = None
+    best_overlap = 1
+
+    for coordinates_path in glob.glob( os.path.join(cache_dir, glob.escape(mode) + "-*.coordinates.npy") ):
+        matrix_path = coordinates_path[ : -len(".coordinates.npy") ] + ".npy"
+        if not os.path.exists(matrix_path):
+            continue
+
+        cached_coordinates = np.load(coordinates_path)
+        cached_indices = { tuple(point): index for index, point in enumerate(cached_coordinates.tolist()) }
+
+        indices = np.array([ cached_indices.get(tuple(point), -1) for point in coordinates.tolist() ], dtype = np.intp)
+        overlap = np.count_nonzero(indices >= 0)
+
+        if overlap > best_overlap:
+            best_path = matrix_path
+            best_indices = indices
+            best_overlap = overlap
+
+    if best_path is None:
+        return None
+
+    return best_path, best_indices
+
+
+# Compute the distance matrix reusing the distances between the points that appear in the cached
+# entry; only the rows (and columns) of the points missing from it are computed.
+def compute_from_overlapping_entry(coordinates, mode, matrix_path, indices):
+    matrix_size = len(coordinates)
+    distance_matrix = np.zeros( (matrix_size, matrix_size) )
+
+    known = np.flatnonzero(indices >= 0)
+    missing = np.flatnonzero(indices < 0)
+
+    cached_matrix = np.load(matrix_path, mmap_mode = "r")
+    distance_matrix[np.ix_(known, known)] = cached_matrix[np.ix_(indices[known], indices[known])]
+
+    if len(missing) > 0:
+        rows = np.repeat(missing, matrix_size)
+        cols = np.tile(np.arange(matrix_size), len(missing))
+
+        distances = compute_pairwise_distances(coordinates[rows, 0], coordinates[rows, 1], coordinates[cols, 0], coordinates[cols, 1], mode)
+        distances[rows == cols] = 0
+
+        distance_matrix[rows, cols] = distances
+        distance_matrix[cols, rows] = distances
+
+    return distance_matrix
+
+
+# Get the distance matrix for the coordinates, through the cache in cache_dir if one is given.
+#
+# A hit opens the stored matrix memory-mapped, i.e. without reading or copying it.
+# On a miss the matrix is computed (reusing the matching part of the cached entry that
+# shares the most points with the coordinates, if there is one), stored and then opened
+# in the same way.
+#
+# @return a (n x n) numpy array of distances, read-only if it comes from the cache
+def get_distance_matrix(coordinates, mode = "geodesic", cache_dir = None):
+    if cache_dir is None:
+        return compute_distance_matrix(coordinates, mode)
+
+    coordinates = np.asarray(coordinates, dtype = np.float64).reshape(-1, 2)
+    matrix_path, coordinates_path = get_entry_paths(cache_dir, mode, compute_cache_key(coordinates, mode))
+
+    if not os.path.exists(matrix_path):
+        os.makedirs(cache_dir, exist_ok = True)
+
+        overlapping_entry = find_overlapping_entry(cache_dir, mode, coordinates)
+        if overlapping_entry is None:
+            distance_matrix = compute_distance_matrix(coordinates, mode)
+        else:
+            distance_matrix = compute_from_overlapping_entry(coordinates, mode, *overlapping_entry)
+
+        # NOTE: the coordinates are saved first, as the existence of the matrix file marks a complete entry
+        save_array(coordinates_path, coordinates)
+        save_array(matrix_path, distance_matrix)
+
+    return np.load(matrix_path, mmap_mode = "r")
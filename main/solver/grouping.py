@@ -1,4 +1,20 @@
-from sklearn.cluster import KMeans
+import math
+import multiprocessing
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+# The ways of clustering the stations into groups for a given number of groups:
+#   kmeans    - an independent k-means clustering for every number of groups
+#   warm      - a single k-means run for every number of groups, started from the centroids of the previous one
+#               and the station that is the furthest from them, i.e. the numbers of groups are tried in order
+#   minibatch - an independent mini-batch k-means clustering for every number of groups, which only pays off
+#               (at the cost of coarser groups) with many more stations than the batches of 1024
+#   balanced  - an independent k-means clustering for every number of groups that keeps the net request of every group
+#               within the vehicle capacity, see fit_balanced_groups()
+CLUSTERINGS = ("kmeans", "warm", "minibatch", "balanced")
+
+# the maximum number of rounds of assigning the stations and moving the centroids of the balanced clustering
+BALANCED_MAX_ITERATIONS = 20
 
 def is_grouping_valid(group_assignments, num_groups, requests, vehicle_capacity):
     group_requests = [ 0 for g in range(0, num_groups) ]
@@ -12,43 +28,201 @@ def is_grouping_valid(group_assignments, num_groups, requests, vehicle_capacity)
 
     return True
 
+# The score of a grouping is the sum of the average distances between two different stations of each group.
+# The distances within the groups are summed by masking the distance matrix with the pairs of stations of the same
+# group, i.e. in O(n^2) numpy operations for n stations, regardless of the number of groups.
 def compute_score(group_assignments, num_groups, distance_matrix):
-    groups = [ [] for g in range(0, num_groups) ]
+    group_assignments = np.asarray(group_assignments)
+    distance_matrix = np.asarray(distance_matrix)
+
+    # the sum of the distances from each station to the stations of its group, summed by group
+    same_group = group_assignments[:, None] == group_assignments[None, :]
+    station_distances = np.where(same_group, distance_matrix, 0).sum(axis = 1)
+    group_distances = np.bincount(group_assignments, weights = station_distances, minlength = num_groups)
+
+    # a useful distance is one between two different stations; as such we disregard
+    # the distances that connect a station to itself
+    group_sizes = np.bincount(group_assignments, minlength = num_groups)
+    num_useful_distances = group_sizes * group_sizes - group_sizes
+
+    avg_dists = np.divide(group_distances, num_useful_distances, out = np.zeros(num_groups), where = num_useful_distances > 0)
+
+    return float( avg_dists.sum() )
+
+# The smallest number of groups that can be valid: the net request of all the stations is divided
+# between the groups, so at least one of fewer groups has a net request out of the vehicle capacity.
+def compute_min_groups(requests, vehicle_capacity):
+    return max(1, math.ceil( abs(sum(requests)) / vehicle_capacity ))
+
+# Cluster the stations into the given number of groups by the k-means (or the mini-batch k-means, or the balanced) clustering.
+# NOTE: compute_station_groups() maps it over the numbers of groups in a pool of processes, i.e. it must stay picklable
+#
+# @return list with the group of each station (None if the balanced clustering failed)
+def fit_groups(coordinates, num_groups, random_state, clustering, requests = None, vehicle_capacity = None):
+    if clustering == "minibatch":
+        return MiniBatchKMeans(n_clusters = num_groups, random_state = random_state).fit_predict(coordinates)
+    elif clustering == "balanced":
+        return fit_balanced_groups(coordinates, num_groups, random_state, requests, vehicle_capacity)
+
+    return KMeans(n_clusters = num_groups, random_state = random_state).fit_predict(coordinates)
+
+# Repair the assignment of the stations to the groups, so that the net request of every group is within the
+# vehicle capacity: while it is not, the group with the largest outstanding request (see problem.utils.compute_outstanding_request())
+# either gives one of its stations to another group or takes one from another group, whichever move reduces
+# the total outstanding request of the groups and increases the (squared) distance of the moved station to
+# the centroid of its group the least. The groups are never emptied. The moves of a group are evaluated at once.
+#
+# @param distances - the squared distance of each station to the centroid of each group
+# @return the repaired assignments (modified in place) or None if no move reduces the outstanding request
+def repair_groups(assignments, distances, requests, vehicle_capacity):
+    num_groups = distances.shape[1]
+    net_requests = np.bincount(assignments, weights = requests, minlength = num_groups).astype(np.int64)
+    sizes = np.bincount(assignments, minlength = num_groups)
+
+    def outstanding(net_request):
+        return np.maximum(0, np.abs(net_request) - vehicle_capacity)
+
+    station_indices = np.arange(0, len(assignments))
+    while True:
+        outstanding_requests = outstanding(net_requests)
+        if outstanding_requests.sum() == 0:
+            return assignments
+
+        group = int( np.argmax(outstanding_requests) )
+        if sizes[group] <= 1:
+            return None
+
+        # the stations of the group moved to any other group: the change of the outstanding request and of the distance
+        members = np.flatnonzero(assignments == group)
+        member_requests = requests[members]
+        out_changes = (outstanding(net_requests[None, :] + member_requests[:, None]) - outstanding_requests[None, :]
+            + ( outstanding(net_requests[group] - member_requests) - outstanding_requests[group] )[:, None])
+        out_costs = distances[members] - distances[members, group][:, None]
+        out_changes[:, group] = 0
+
+        # the stations of the other groups (that would not be emptied) moved to the group
+        in_changes = (outstanding(net_requests[group] + requests) - outstanding_requests[group]
+            + outstanding(net_requests[assignments] - requests) - outstanding_requests[assignments])
+        in_costs = distances[:, group] - distances[station_indices, assignments]
+        in_changes[ (assignments == group) | (sizes[assignments] <= 1) ] = 0
+
+        out_costs = np.where(out_changes < 0, out_costs, np.inf)
+        in_costs = np.where(in_changes < 0, in_costs, np.inf)
+
+        best_out = int( np.argmin(out_costs) )
+        best_in = int( np.argmin(in_costs) )
+        if out_costs.flat[best_out] == np.inf and in_costs[best_in] == np.inf:
+            return None
+
+        if out_costs.flat[best_out] <= in_costs[best_in]:
+            member, new_group = divmod(best_out, num_groups)
+            station, old_group = members[member], group
+        else:
+            station, old_group, new_group = best_in, int( assignments[best_in] ), group
+
+        assignments[station] = new_group
+        net_requests[old_group] -= requests[station]
+        net_requests[new_group] += requests[station]
+        sizes[old_group] -= 1
+        sizes[new_group] += 1
+
+# Cluster the stations into the given number of groups by a capacity-constrained version of the k-means (Lloyd's
+# algorithm), in which the request of every station is a signed weight: starting from the k-means clustering, the stations
+# are assigned to their closest centroids, the assignment is repaired so that the net request of every group is within
+# the vehicle capacity (see repair_groups()) and the centroids are moved to the means of their groups, until the
+# assignment does not change (or for at most BALANCED_MAX_ITERATIONS rounds).
+#
+# @return list with the group of each station or None if the assignment could not be repaired
+def fit_balanced_groups(coordinates, num_groups, random_state, requests, vehicle_capacity):
+    coordinates = np.asarray(coordinates, dtype = np.float64)
+    requests = np.asarray(requests, dtype = np.int64)
+
+    kmeans = KMeans(n_clusters = num_groups, random_state = random_state).fit(coordinates)
+    centroids = kmeans.cluster_centers_
+    assignments = kmeans.labels_.astype(np.intp)
+
+    for iteration in range(0, BALANCED_MAX_ITERATIONS):
+        distances = ( (coordinates[:, None, :] - centroids[None, :, :]) ** 2 ).sum(axis = 2)
+
+        # the closest centroids, unless a group would be left empty
+        closest = np.argmin(distances, axis = 1)
+        new_assignments = closest if iteration > 0 and len(np.unique(closest)) == num_groups else assignments.copy()
+
+        new_assignments = repair_groups(new_assignments, distances, requests, vehicle_capacity)
+        if new_assignments is None:
+            # the last repaired assignment (if any) is still valid
+            return assignments if iteration > 0 else None
+
+        if iteration > 0 and np.array_equal(new_assignments, assignments):
+            break
+        assignments = new_assignments
+
+        sizes = np.bincount(assignments, minlength = num_groups)
+        centroids = np.stack([ np.bincount(assignments, weights = coordinates[:, axis], minlength = num_groups) / sizes for axis in range(0, coordinates.shape[1]) ], axis = 1)
+
+    return assignments
+
+# Cluster the stations into each of the numbers of groups in turn, every k-means run starting from the centroids
+# of the previous one and the station that is the furthest from its closest centroid (which becomes the new one).
+#
+# @return list of the group assignments, one for each number of groups
+def fit_warm_started_groups(coordinates, numbers_of_groups, random_state):
+    coordinates = np.asarray(coordinates, dtype = np.float64)
+
+    all_assignments = []
+    centroids = None
+    for num_groups in numbers_of_groups:
+        if centroids is None or len(centroids) >= num_groups:
+            kmeans = KMeans(n_clusters = num_groups, random_state = random_state)
+        else:
+            while len(centroids) < num_groups:
+                squared_distances = ( (coordinates[:, None, :] - centroids[None, :, :]) ** 2 ).sum(axis = 2).min(axis = 1)
+                centroids = np.vstack([ centroids, coordinates[ np.argmax(squared_distances) ] ])
+            kmeans = KMeans(n_clusters = num_groups, init = centroids, n_init = 1, random_state = random_state)
+
+        all_assignments.append( kmeans.fit_predict(coordinates) )
+        centroids = kmeans.cluster_centers_
+
+    return all_assignments
+
+# Divide the stations into at most vehicle_num groups, the net request of each within the vehicle capacity,
+# by clustering their coordinates (see CLUSTERINGS) into each number of groups that can be valid, from
+# compute_min_groups() to min(stations, vehicle_num), and choosing the valid grouping with the best score.
+#
+# The independent clusterings are run in a pool of processes (one per core if processes is None);
+# the warm-started ones are run in order, in the current process.
+#
+# NOTE: random_state seeds the k-means clustering, None gives a different grouping on each call
+#
+# @return a pair: (list with the group of each station, number of groups) or (None, 0) if no grouping is valid
+def compute_station_groups(coordinates, distance_matrix, requests, vehicle_num, vehicle_capacity, random_state = None,
+        clustering = "kmeans", processes = 1):
+    if clustering not in CLUSTERINGS:
+        raise ValueError("Unknown clustering: " + str(clustering) + " (available: " + ", ".join(CLUSTERINGS) + ")")
 
-    for station, group in enumerate(group_assignments):
-        groups[group].append(station)
-
-    score = 0
-    for group in groups:
-        # compute the distance matrix for the group of vertices
-        group_distance_matrix = [ [dist for w, dist in enumerate(distances) if w in group] for v, distances in enumerate(distance_matrix) if v in group ]
-
-        # flatten the matrix
-        group_distances = [ dist for row in group_distance_matrix for dist in row ]
-
-        # a useful distance is one between two different stations; as such we disregard
-        # the distances that connect a station to itself;
-        # there are len(group_distance_matrix) such distances
-        num_useful_distances = len(group_distances) - len(group_distance_matrix)
-
-        avg_dist = sum(group_distances) / num_useful_distances if num_useful_distances > 0 else 0
+    max_groups = min( len(requests), vehicle_num )
+    numbers_of_groups = list( range(compute_min_groups(requests, vehicle_capacity), max_groups + 1) )
 
-        score += avg_dist
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(numbers_of_groups)))
 
-    return score
+    # create a classifier for each number of groups and compute the clusters/groups
+    if clustering == "warm":
+        all_assignments = fit_warm_started_groups(coordinates, numbers_of_groups, random_state)
+    elif processes <= 1:
+        all_assignments = [ fit_groups(coordinates, num_groups, random_state, clustering, requests, vehicle_capacity) for num_groups in numbers_of_groups ]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            all_assignments = pool.starmap(fit_groups, [ (coordinates, num_groups, random_state, clustering, requests, vehicle_capacity) for num_groups in numbers_of_groups ])
 
-def compute_station_groups(coordinates, distance_matrix, requests, vehicle_num, vehicle_capacity):
     best_assignments = None
     best_num_groups = 0
     best_score = 0
 
-    max_groups = min( len(requests), vehicle_num )
-    for num_groups in range(1, max_groups + 1):
-        # create a kmeans classifier and compute the clusters/groups
-        group_assignments = KMeans(n_clusters = num_groups).fit_predict(coordinates)
-
+    for num_groups, group_assignments in zip(numbers_of_groups, all_assignments):
         # verify if the grouping is valid
-        if is_grouping_valid(group_assignments, num_groups, requests, vehicle_capacity):
+        if group_assignments is not None and is_grouping_valid(group_assignments, num_groups, requests, vehicle_capacity):
             current_score = compute_score(group_assignments, num_groups, distance_matrix)
 
             # check if best grouping yet or if first tested
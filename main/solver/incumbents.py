@@ -0,0 +1,45 @@
+import json
+import time
+
+
+# Streams the improving solutions (incumbents) of a search to a JSON Lines file, one line per solution:
+#   { "time": <unix time>, "label": <label>, "cost": <cost>, "solution": [ [initial load, path], ... ] }
+# where the solution has the same format as the "solution" of the result of solve(), i.e. the paths
+# are made of the vertex indices (the depot is 0), not of the station ids. The label is omitted if None.
+#
+# The writer is called as on_improvement(solution, cost) by the search engines (see algorithms) and can be
+# pickled, so the chains run by worker processes append to the same file; every line is written (and flushed)
+# with a single call, so the lines of different processes are not mixed.
+class IncumbentWriter:
+    def __init__(self, file_path, label = None):
+        self._file_path = file_path
+        self._label = label
+
+    @property
+    def file_path(self):
+        return self._file_path
+
+    # a writer to the same file with another label, e.g. for the groups of stations
+    def with_label(self, label):
+        return IncumbentWriter(self._file_path, label)
+
+    def __call__(self, solution, cost):
+        line = { "time": time.time() }
+        if self._label is not None:
+            line["label"] = self._label
+        line["cost"] = float(cost)
+        line["solution"] = get_solution_routes(solution)
+
+        with open(self._file_path, "a") as file:
+            file.write( json.dumps(line) + "\n" )
+
+
+# The routes of the solution as a list of [initial load, path], for both the SBRP and the 1-PDTSP solutions.
+# NOTE: the path of a 1-PDTSP solution is mapped to the vertices of the problem its group comes from
+def get_solution_routes(solution):
+    if hasattr(solution, "vehicle_paths"):
+        routes = zip(solution.get_initial_loads(), solution.vehicle_paths)
+    else:
+        routes = [ (solution.load_windows.initial_load, solution.global_vehicle_path) ]
+
+    return [ [ int(initial_load), [ int(vertex) for vertex in path ] ] for initial_load, path in routes ]
@@ -0,0 +1,95 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from algorithms import write_file_atomically
+
+
+# A cache of the requests of the stations, keyed by the utilisation data of a station
+# (capacity, inventory, pickups, returns), the maximum request and the requests mode.
+#
+# The entries are kept in memory with the least recently used evicted first once the cache
+# holds max_size entries. If a file is given, the cache is loaded from it when created and
+# saved to it by save(), so that it can be shared by separate runs (and processes).
+#
+# NOTE: in the "simulation" mode the cached request is the one computed for the first realisation
+#       of the demand, i.e. the same station state always gets the same request afterwards
+class RequestCache:
+    @staticmethod
+    def compute_key(station_utilisation, max_request, mode):
+        capacity, inventory, pickups, returns = station_utilisation
+        key_data = json.dumps([ capacity, inventory, list(pickups), list(returns), max_request, mode ])
+
+        return hashlib.sha1(key_data.encode()).hexdigest()
+
+    def __init__(self, max_size = 100000, file_path = None):
+        self._entries = OrderedDict()
+        self._max_size = max_size
+        self._file_path = file_path
+
+        self._hits = 0
+        self._misses = 0
+
+        if file_path is not None and os.path.exists(file_path):
+            self._entries.update( self._load_entries(file_path) )
+            self._evict()
+
+    @property
+    def stats(self):
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "size": len(self._entries)
+        }
+
+    def get(self, key):
+        request = self._entries.get(key)
+        if request is None:
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        self._entries.move_to_end(key)
+        return request
+
+    def put(self, key, request):
+        self._entries[key] = request
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def save(self):
+        if self._file_path is None:
+            return
+
+        # merge the entries saved by other processes in the meantime, the ones in memory take precedence
+        entries = self._load_entries(self._file_path) if os.path.exists(self._file_path) else {}
+        entries.update(self._entries)
+
+        # write atomically, so that a partially written cache is never loaded
+        os.makedirs(os.path.dirname( os.path.abspath(self._file_path) ), exist_ok = True)
+        write_file_atomically(self._file_path, lambda file: json.dump(dict( list(entries.items())[-self._max_size : ] ), file))
+
+    def _evict(self):
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last = False)
+
+    @staticmethod
+    def _load_entries(file_path):
+        try:
+            with open(file_path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, json.decoder.JSONDecodeError):
+            print("Unable to load the request cache from a file: " + file_path)
+            return {}
+
+
+# the caches shared by all solve() calls in the process, one per file (None for the in-memory only cache)
+shared_caches = {}
+
+def get_request_cache(file_path = None):
+    cache = shared_caches.get(file_path)
+    if cache is None:
+        cache = RequestCache(file_path = file_path)
+        shared_caches[file_path] = cache
+
+    return cache
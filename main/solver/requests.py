@@ -1,4 +1,5 @@
 import random
+import numpy as np
 
 
 # WARNING: the function modifies the following arguments: inventories
@@ -44,11 +45,243 @@ def compute_station_request(station_utilisation, max_request):
     # which is equivalent to:
     return length_left - lost_demand.index( min(lost_demand) )
 
-def compute_requests(utilisation_data, max_request):
-    requests = []
+# Draw a random realisation of the demand of a station, i.e. the order in which the pickups (-1)
+# and returns (+1) are attempted in each time bucket.
+# NOTE: the random numbers are drawn exactly as in simulate_demand_realisation(), from the given
+#       random number generator (random.Random instance or the random module itself)
+def generate_demand_realisation(pickups, returns, rng = random):
+    actions = []
 
-    for station_utilisation in utilisation_data:
-        station_request = compute_station_request(station_utilisation, max_request)
-        requests.append(station_request)
+    for p, r in zip(pickups, returns):
+        pickup_probability = p / (p + r) if p + r > 0 else 0
+        while p + r > 0:
+            if p > 0 and (rng.random() <= pickup_probability or r <= 0):   # a pickup is attempted
+                actions.append(-1)
+                p -= 1
+            else:   # a return is attempted
+                actions.append(1)
+                r -= 1
+
+    return actions
+
+# Compress a realisation of the demand into runs of identical actions, each given as
+# the sum of its actions (e.g. three pickups in a row become -3).
+def compress_demand_realisation(actions):
+    actions = np.asarray(actions, dtype = int)
+    if len(actions) == 0:
+        return actions
+
+    run_starts = np.flatnonzero( np.diff(actions, prepend = 0) )
+    return np.add.reduceat(actions, run_starts)
+
+# Vectorised version of simulate_demand_realisation() for many stations at once.
+#
+# A run of m pickups (or returns) is applied in a single step: starting with an inventory x
+# min(m, x) bikes are collected and the remaining max(0, m - x) pickups are lost (and similarly
+# for the returns with the free docks capacity - x).
+#
+# @param capacities the capacity of each station, an array of shape (stations,)
+# @param inventories the candidate inventory levels of each station, an array of shape (stations, candidates)
+# @param realisations the realisation of the demand of each station, see generate_demand_realisation()
+# @return the lost demand for each candidate inventory level, an array of shape (stations, candidates)
+def simulate_demand_realisations(capacities, inventories, realisations):
+    runs = [ compress_demand_realisation(actions) for actions in realisations ]
+    lengths = np.array([ len(station_runs) for station_runs in runs ], dtype = int)
+
+    # order the stations by the number of runs (longest first), so that the stations
+    # that still have runs to apply at step t are always the first ones
+    order = np.argsort(-lengths, kind = "stable")
+    lengths = lengths[order]
+
+    max_length = lengths[0] if len(lengths) > 0 else 0
+    padded_runs = np.zeros( (len(runs), max_length), dtype = int )
+    for row, station in enumerate(order):
+        padded_runs[row, : lengths[row]] = runs[station]
+
+    current_inventories = np.array(inventories, dtype = int)[order]
+    station_capacities = np.asarray(capacities, dtype = int)[order][:, None]
+    lost_demand = np.zeros(current_inventories.shape, dtype = int)
+
+    # apply the t-th run of every station to all its candidate inventory levels at once
+    num_active = len(lengths)
+    for t in range(0, max_length):
+        while lengths[num_active - 1] <= t:
+            num_active -= 1
+
+        active_capacities = station_capacities[:num_active]
+        updated_inventories = current_inventories[:num_active] + padded_runs[:num_active, t, None]
+
+        # the actions that would take the inventory below 0 or above the capacity are lost
+        lost_demand[:num_active] += np.maximum(0, -updated_inventories) + np.maximum(0, updated_inventories - active_capacities)
+        np.clip(updated_inventories, 0, active_capacities, out = current_inventories[:num_active])
+
+    # restore the original order of the stations
+    station_lost_demand = np.empty_like(lost_demand)
+    station_lost_demand[order] = lost_demand
+
+    return station_lost_demand
+
+# Compute exactly the expected lost demand of each station for every starting inventory level,
+# i.e. the average of simulate_demand_realisation() over all the realisations of the demand,
+# weighted by their probabilities.
+#
+# The expectation is computed backwards, from the last time bucket to the first one. Within a bucket
+# with p pickups and r returns the state is (i, j, x): i pickups and j returns have been attempted and
+# the inventory is x. While both remain, a pickup is attempted with the probability p / (p + r), as in
+# generate_demand_realisation(), and the expected future lost demand satisfies:
+#   W(i, j, x) = q * ( [x == 0] + W(i+1, j, max(x-1, 0)) ) + (1 - q) * ( [x == capacity] + W(i, j+1, min(x+1, capacity)) )
+# where q = p / (p + r) if both pickups and returns remain, 1 if only pickups remain, 0 if only returns remain,
+# and W(p, r, x) is the expected lost demand from the next bucket on when starting it with the inventory x.
+#
+# The cells (i, j) are processed by anti-diagonals (i + j), so that a whole diagonal of every station is
+# computed in one vectorised step; only the last diagonal is kept, as a vector of slots indexed by i.
+# The work is O(p * r * capacity) for a bucket, which is negligible for hourly buckets.
+#
+# @return an array of shape (stations, max_capacity + 1), the entries above the capacity of a station are meaningless
+def compute_expected_lost_demand(capacities, pickups, returns):
+    num_stations = len(capacities)
+    num_buckets = max([ len(station_pickups) for station_pickups in pickups ], default = 0)
+
+    capacities = np.asarray(capacities, dtype = int)
+    levels = np.arange(capacities.max() + 1 if num_stations > 0 else 1)
+
+    # whether a pickup/return is lost, for every inventory level
+    lost_pickup = (levels == 0).astype(float)
+    lost_return = (levels == capacities[:, None]).astype(float)
+
+    # the buckets of all stations are padded to the same number with zero demand
+    bucket_pickups = np.zeros( (num_stations, num_buckets), dtype = int )
+    bucket_returns = np.zeros( (num_stations, num_buckets), dtype = int )
+    for station in range(0, num_stations):
+        bucket_pickups[station, : len(pickups[station])] = pickups[station]
+        bucket_returns[station, : len(returns[station])] = returns[station]
+
+    expected_lost_demand = np.zeros( (num_stations, len(levels)) )
+    for bucket in reversed(range(0, num_buckets)):
+        p = bucket_pickups[:, bucket]
+        r = bucket_returns[:, bucket]
+        events = p + r
+
+        # only the stations with some demand in the bucket, ordered by the number of events (most first),
+        # so that the stations whose diagonals remain at step t are always the first ones
+        order = np.argsort(-events, kind = "stable")
+        order = order[ events[order] > 0 ]
+        if len(order) == 0:
+            continue
+
+        events = events[order]
+
+        # each station has p + 2 slots (the last one is only read with a zero weight)
+        slot_counts = p[order] + 2
+        slot_offsets = np.concatenate( ([0], np.cumsum(slot_counts)) )
+        slot_station = np.repeat(order, slot_counts)
+        slot_i = np.arange(slot_offsets[-1]) - np.repeat(slot_offsets[:-1], slot_counts)
+
+        slot_p = p[slot_station]
+        slot_r = r[slot_station]
+        slot_events = slot_p + slot_r
+        slot_capacity = capacities[slot_station]
+        slot_lost_return = lost_return[slot_station]
+
+        # the probability of a pickup in the cell of each slot; it does not depend on the diagonal,
+        # because the cells in which only returns (i == p) remain always have the same slots
+        slot_q = np.where( slot_i == slot_p, 0, slot_p / slot_events )[:, None]
+
+        # the terminal cell (p, r) holds the expected lost demand from the next bucket on
+        # NOTE: one more (padding) slot at the end, so that the slot i+1 can be read for every slot
+        W = expected_lost_demand[ np.append(slot_station, 0) ]
+
+        for t in range(1, events[0] + 1):
+            num_active = np.searchsorted(-events, -t, side = "right")     # the stations with at least t events
+            num_slots = slot_offsets[num_active]
+            slots = np.arange(num_slots)
+
+            j = slot_events[:num_slots] - t - slot_i[:num_slots]
+            valid = ( (slot_i[:num_slots] <= slot_p[:num_slots]) & (j >= 0) & (j <= slot_r[:num_slots]) )[:, None]
+
+            # only pickups remain once all the returns have been attempted
+            q = np.where( (j == slot_r[:num_slots])[:, None], 1, slot_q[:num_slots] )
+
+            # the value after a pickup is read from the cell (i+1, j), i.e. the next slot, at the level max(x-1, 0)
+            after_pickup_value = np.empty( (num_slots, len(levels)) )
+            after_pickup_value[:, 1:] = W[1 : num_slots + 1, :-1]
+            after_pickup_value[:, 0] = W[1 : num_slots + 1, 0]
+            after_pickup_value += lost_pickup
+
+            # the value after a return is read from the cell (i, j+1), i.e. the same slot, at the level min(x+1, capacity)
+            after_return_value = np.empty( (num_slots, len(levels)) )
+            after_return_value[:, :-1] = W[:num_slots, 1:]
+            after_return_value[:, -1] = W[:num_slots, -1]
+            after_return_value[slots, slot_capacity[:num_slots]] = W[slots, slot_capacity[:num_slots]]
+            after_return_value += slot_lost_return[:num_slots]
+
+            W[:num_slots] = np.where( valid, q * after_pickup_value + (1 - q) * after_return_value, W[:num_slots] )
+
+        # the cell (0, 0) of each station is the expected lost demand from the start of the bucket on
+        expected_lost_demand[order] = W[ slot_offsets[:-1] ]
+
+    return expected_lost_demand
+
+# The available ways of computing the requests:
+#   simulation  - the best inventory level for a single random realisation of the demand (the original approach)
+#   expectation - the inventory level with the minimum expected lost demand, see compute_expected_lost_demand();
+#                 deterministic, i.e. the same utilisation data always give the same requests
+#                 NOTE: its cost grows with (pickups * returns) in a bucket, it is meant for hourly demand
+#                       and not for buckets with thousands of events
+REQUESTS_MODES = ("simulation", "expectation")
+
+# Compute the requests of the stations, through the given RequestCache if there is one;
+# only the stations missing from the cache are computed (all at once).
+# The realisations of the demand in the "simulation" mode are drawn from the given random number generator.
+def compute_requests(utilisation_data, max_request, mode = "simulation", cache = None, rng = random):
+    if mode not in REQUESTS_MODES:
+        raise ValueError("Unknown requests mode: " + str(mode) + " (available: " + ", ".join(REQUESTS_MODES) + ")")
+
+    if cache is None:
+        return compute_uncached_requests(utilisation_data, max_request, mode, rng)
+
+    keys = [ cache.compute_key(station_utilisation, max_request, mode) for station_utilisation in utilisation_data ]
+    requests = [ cache.get(key) for key in keys ]
+
+    missing = [ station for station, request in enumerate(requests) if request is None ]
+    missing_requests = compute_uncached_requests([ utilisation_data[station] for station in missing ], max_request, mode, rng)
+
+    for station, request in zip(missing, missing_requests):
+        requests[station] = request
+        cache.put(keys[station], request)
 
     return requests
+
+def compute_uncached_requests(utilisation_data, max_request, mode, rng = random):
+    if len(utilisation_data) == 0:
+        return []
+
+    capacities = np.array([ capacity for capacity, _, _, _ in utilisation_data ], dtype = int)
+    current_inventories = np.array([ inventory for _, inventory, _, _ in utilisation_data ], dtype = int)
+
+    # compute the valid range of inventories of each station, as in compute_station_request()
+    lengths_left = np.minimum(current_inventories, max_request)
+    lengths_right = np.minimum(capacities - current_inventories, max_request)
+    num_valid = lengths_left + lengths_right + 1
+
+    # the ranges have different lengths, the shorter ones are padded by repeating their last inventory level
+    offsets = np.minimum( np.arange(num_valid.max()), (num_valid - 1)[:, None] )
+    valid_inventories = (current_inventories - lengths_left)[:, None] + offsets
+
+    if mode == "expectation":
+        expected_lost_demand = compute_expected_lost_demand(capacities, [ pickups for _, _, pickups, _ in utilisation_data ], [ returns for _, _, _, returns in utilisation_data ])
+
+        # NOTE: rounded, so that the levels with the same expectation are tied regardless of the floating-point errors
+        lost_demand = np.round( np.take_along_axis(expected_lost_demand, valid_inventories, axis = 1), 9 )
+        lost_demand[ offsets != np.arange(num_valid.max()) ] = np.inf
+
+        return ( lengths_left - np.argmin(lost_demand, axis = 1) ).tolist()
+
+    # NOTE: the realisations are drawn station by station, i.e. the random numbers are used in the same order as by compute_station_request()
+    realisations = [ generate_demand_realisation(pickups, returns, rng) for _, _, pickups, returns in utilisation_data ]
+
+    lost_demand = simulate_demand_realisations(capacities, valid_inventories, realisations)
+
+    # exclude the padding and choose the inventory level with the minimum lost demand (the first one if tied)
+    lost_demand[ offsets != np.arange(num_valid.max()) ] = np.iinfo(lost_demand.dtype).max
+    return ( lengths_left - np.argmin(lost_demand, axis = 1) ).tolist()
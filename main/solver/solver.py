@@ -1,9 +1,18 @@
+import os
 import time
-from .requests import compute_requests
-from .distance import compute_distance_matrix
-from .grouping import compute_station_groups
+import random
+import multiprocessing
+from .requests import compute_requests, REQUESTS_MODES
+from .request_cache import get_request_cache
+from .distance_cache import get_distance_matrix
+from .grouping import compute_station_groups, CLUSTERINGS
+from .distance import DISTANCE_MODES
+from .incumbents import IncumbentWriter
 from problem import SBRP, OnePDTSP, SBRP_Solution
-from algorithms import simulated_annealing
+from problem.OnePDTSP_Solution import OnePDTSP_Solution
+from problem.SBRP import INITIAL_SOLUTIONS
+from problem.utils import CONSTRUCTIONS, ASSIGNMENTS
+from algorithms import parallel_simulated_annealing, parallel_tempering, Checkpointer, load_checkpoint
 
 
 # def solve_OnePDTSP(coordinates, requests, vehicle_num, vehicle_capacity):
@@ -20,15 +29,30 @@ from algorithms import simulated_annealing
 #
 #     return solution, solution_time
 #
-def solve_multiple_OnePDTSP(coordinates, requests, vehicle_num, vehicle_capacity, hyperparameters):
+# The time (in seconds) that is left until the deadline (in the time of time.monotonic()), None if there is no deadline.
+def get_remaining_time(deadline):
+    return max(0, deadline - time.monotonic()) if deadline is not None else None
+
+# The solvers below search within the deadline (in the time of time.monotonic(), None for no limit) given by solve(),
+# i.e. the time they take to compute the distances and the initial solutions counts towards the time limit.
+def solve_multiple_OnePDTSP(coordinates, requests, vehicle_num, vehicle_capacity, hyperparameters, options, stats = None, checkpointer = None, deadline = None):
+    # NOTE: the groups are searched independently (and possibly in parallel), they are not checkpointed
+    if checkpointer is not None:
+        raise ValueError("Checkpoints are only supported by the algorithm 1")
+
     # compute the distance matrix
-    distance_matrix = compute_distance_matrix(coordinates)
+    distance_matrix = get_distance_matrix(coordinates, options.get("distance_mode"), options.get("distance_cache_dir"))
 
-    # compute the distance matrix only for stations
-    stations_distance_matrix = [ row[1:] for row in distance_matrix[1:] ]
+    # create an instance of the whole problem, the groups are solved as its sub-problems
+    sbrp = SBRP(distance_matrix, requests, vehicle_num, vehicle_capacity, options.get("distance_dtype"), options.get("packed_distances"), options.get("construction"))
 
     # divide the stations into groups
-    group_assignments, num_groups = compute_station_groups(coordinates[1:], stations_distance_matrix, requests, vehicle_num, vehicle_capacity)
+    # NOTE: the distance matrix only for stations is a view, it is not copied
+    group_assignments, num_groups = compute_station_groups(coordinates[1:], distance_matrix[1:, 1:], requests, vehicle_num, vehicle_capacity, options.get("seed"), options.get("clustering"), options.get("processes"))
+
+    # the other clusterings ignore the requests, if none of their groupings is valid the balanced one is tried
+    if group_assignments is None and options.get("clustering") != "balanced":
+        group_assignments, num_groups = compute_station_groups(coordinates[1:], distance_matrix[1:, 1:], requests, vehicle_num, vehicle_capacity, options.get("seed"), "balanced", options.get("processes"))
 
     if group_assignments is None:
         return None
@@ -39,43 +63,126 @@ def solve_multiple_OnePDTSP(coordinates, requests, vehicle_num, vehicle_capacity
         vertex = station + 1
         groups[group].append(vertex)
 
+    # the chains of each group are seeded from the master seed and the index of the group
+    group_problems = [ sbrp.get_group_problem(group) for group in groups ]
+    master_seeds = [ [ options.get("seed"), group_index ] if options.get("seed") is not None else None for group_index in range(0, num_groups) ]
+
+    processes = options.get("processes") if options.get("processes") is not None else os.cpu_count()
+    processes = min(processes, num_groups)
+
+    # the incumbents of each group are streamed with the label group_<index>
+    labels = [ "group_" + str(group_index) for group_index in range(0, num_groups) ]
+
+    # the time is shared between the groups in proportion to their numbers of stations, except for the groups
+    # with no neighbours (at most 2 stations), which keep their initial solution, i.e. their search stops at once
+    # and they get no share (they are only held to the deadline)
+    weights = [ len(group) - 1 if OnePDTSP_Solution.get_neighbourhood_size( len(group) ) > 0 else 0 for group in groups ]
+
     # solve OnePDTSP on each group
-    solutions = []
-    for group in groups:
-        # compute the distance matrix for the group of vertices
-        group_distance_matrix = [ [dist for w, dist in enumerate(distances) if w in group] for v, distances in enumerate(distance_matrix) if v in group ]
+    if processes <= 1:
+        # the time that is left is shared between the groups that are left
+        results = []
+        for group_index in range(0, num_groups):
+            group_options = options
+            if deadline is not None:
+                remaining_weight = sum( weights[group_index:] )
+                share = weights[group_index] / remaining_weight if weights[group_index] > 0 else 1
+                group_options = { **options, "time_limit": get_remaining_time(deadline) * share }
 
-        # compute the list of requests for the stations in the group
-        group_requests = [ r for station, r in enumerate(requests) if station + 1 in group ]
+            results.append( run_group_search(group_problems[group_index], hyperparameters, group_options, master_seeds[group_index], labels[group_index]) )
+    else:
+        # the groups are independent, they are solved by a pool of processes, the largest first to balance
+        # the load between the processes; the search of each group is run in its process only
+        # NOTE: the processes of a pool cannot start processes of their own
+        # NOTE: the time of all the processes is shared, a group that starts late is cut off at the deadline
+        all_group_options = [ { **options, "processes": 1 } for group_index in range(0, num_groups) ]
+        if deadline is not None:
+            pool_time = get_remaining_time(deadline) * processes
+            total_weight = sum(weights)
+            for group_index in range(0, num_groups):
+                all_group_options[group_index]["time_limit"] = pool_time * weights[group_index] / total_weight if weights[group_index] > 0 else pool_time
+        schedule = sorted( range(0, num_groups), key = lambda group_index: len(groups[group_index]), reverse = True )
 
-        problem = OnePDTSP(group_distance_matrix, group_requests, vehicle_capacity)
+        with multiprocessing.Pool(processes) as pool:
+            pending_results = { group_index: pool.apply_async(run_group_search, (group_problems[group_index], hyperparameters, all_group_options[group_index], master_seeds[group_index], labels[group_index], deadline)) for group_index in schedule }
+            results = [ pending_results[group_index].get() for group_index in range(0, num_groups) ]
 
-        solution = simulated_annealing(problem, hyperparameters)
-        if solution is None:
-            return None
+    solutions = [ solution for solution, group_stats in results ]
 
-        solutions.append(solution)
+    if stats is not None:
+        stats.update( combine_group_stats([ group_stats for solution, group_stats in results ]) )
+
+    if any( [ solution is None for solution in solutions ] ):
+        return None
 
     # combine the OnePDTSP solutions into a SBRP solution
-    final_solution = SBRP_Solution.construct_from_OnePDTSPs(solutions, groups, SBRP(distance_matrix, requests, vehicle_num, vehicle_capacity))
+    final_solution = SBRP_Solution.construct_from_OnePDTSPs(solutions, sbrp)
 
     return final_solution
 
+# Run the search engine chosen in the options on the problem, seeded from the given master seed, within
+# the budgets of the options. The improving solutions are streamed to the incumbent file (if one is given)
+# with the given label and the statistics of the search are put in stats (if given). The simulated annealing
+# can be checkpointed by the given checkpointer.
+def run_search(problem, hyperparameters, options, master_seed, label = None, stats = None, checkpointer = None):
+    on_improvement = IncumbentWriter(options.get("incumbent_file"), label) if options.get("incumbent_file") is not None else None
+    budget = ( options.get("time_limit"), options.get("iteration_limit"), on_improvement, options.get("incumbent_interval"), stats )
+
+    if options.get("engine") == "tempering":
+        if checkpointer is not None:
+            raise ValueError("Checkpoints are only supported by the annealing search engine")
+
+        return parallel_tempering(problem, hyperparameters, master_seed, options.get("processes"), *budget)
+
+    return parallel_simulated_annealing(problem, hyperparameters, options.get("chains"), master_seed, options.get("processes"), *budget, checkpointer)
+
+# Run the search on the problem of a group of stations, within its time limit and the deadline of the whole search (if given).
+# NOTE: the pool of solve_multiple_OnePDTSP() runs it in the worker processes, see run_chain() in algorithms/parallelchains.py
+#
+# @return a pair: (the solution or None, the statistics of the search)
+def run_group_search(problem, hyperparameters, options, master_seed, label, deadline = None):
+    if deadline is not None:
+        options = { **options, "time_limit": min(options.get("time_limit"), get_remaining_time(deadline)) }
+
+    group_stats = {}
+    solution = run_search(problem, hyperparameters, options, master_seed, label, group_stats)
+
+    return solution, group_stats
+
+# the reasons why a search stopped, the first one that stopped any of the groups is the reason of all of them
+STOP_REASONS = ("no_initial_solution", "time_limit", "iteration_limit", "no_neighbour", "stagnation", "schedule")
+
+# Combine the statistics of the searches of the groups into the statistics of the whole search.
+def combine_group_stats(group_stats):
+    stop_reasons = [ stats.get("stop_reason") for stats in group_stats ]
+
+    return {
+        "iterations": sum( [ stats.get("iterations", 0) for stats in group_stats ] ),
+        "accepted": sum( [ stats.get("accepted", 0) for stats in group_stats ] ),
+        "initial_cost": sum( [ stats.get("initial_cost", 0) for stats in group_stats ] ),
+        "best_cost": sum( [ stats.get("best_cost", 0) for stats in group_stats ] ),
+        "elapsed_time": sum( [ stats.get("elapsed_time", 0) for stats in group_stats ] ),
+        "stop_reason": next( (reason for reason in STOP_REASONS if reason in stop_reasons), None ),
+        "groups": group_stats
+    }
+
 # function only for degugging
 def print_m(matrix):
     for line in matrix:
         print(line)
     print()
 
-def solve_SBRP(coordinates, requests, vehicle_num, vehicle_capacity, hyperparameters):
+def solve_SBRP(coordinates, requests, vehicle_num, vehicle_capacity, hyperparameters, options, stats = None, checkpointer = None, deadline = None):
     # compute the distance matrix
-    distance_matrix = compute_distance_matrix(coordinates)
+    distance_matrix = get_distance_matrix(coordinates, options.get("distance_mode"), options.get("distance_cache_dir"))
     # print_m(distance_matrix)  # <- for debugging only
 
     # create an instance of the problem
-    problem = SBRP(distance_matrix, requests, vehicle_num, vehicle_capacity)
+    problem = SBRP(distance_matrix, requests, vehicle_num, vehicle_capacity, options.get("distance_dtype"), options.get("packed_distances"), options.get("construction"), options.get("initial_solution"), options.get("assignment"))
 
-    solution = simulated_annealing(problem, hyperparameters)
+    # the search is given the time that is left
+    search_options = { **options, "time_limit": get_remaining_time(deadline) }
+    solution = run_search(problem, hyperparameters, search_options, options.get("seed"), stats = stats, checkpointer = checkpointer)
 
     return solution
 
@@ -104,13 +211,94 @@ algorithms = {
     }
 }
 
-def solve(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm = "1", hyperparameters = "default"):
+# The search engines that can be used by both algorithms:
+#   annealing - simulated annealing with a geometric schedule (the hyperparameters of each algorithm above),
+#               run as the given number of independent chains
+#   tempering - parallel tempering (replica exchange) at a fixed ladder of temperatures
+SEARCH_ENGINES = ("annealing", "tempering")
+
+tempering_default_hyperparameters = {
+    "initial_probability_threshold": 0.95,  # the hottest replica accepts all neighbours of an initial solution with at least this probability
+    "min_temp_percentage": 0.005,   # the temperature of the coldest replica, as a percentage of the hottest one
+    "replicas": 8,  # number of replicas, i.e. of temperatures on the ladder
+    "sweep_length": 50, # number of steps of each replica between two rounds of exchanges
+    "sweeps": 200   # number of rounds of exchanges
+}
+
+# options that are independent of the solution approach, i.e. how the input of the algorithms is computed
+default_options = {
+    "requests_mode": "simulation",  # one of requests.REQUESTS_MODES
+    "request_cache": False,         # reuse the requests of the stations in the same state across solve() calls
+    "request_cache_file": None,     # file in which the request cache is persisted (enables the cache)
+    "distance_mode": "geodesic",    # one of distance.DISTANCE_MODES
+    "distance_cache_dir": None,     # directory of the on-disk distance matrix cache, None disables the cache
+    "distance_dtype": "float64",    # dtype in which the problems store the distance matrix, "float32" halves the memory
+    "packed_distances": False,      # store only the upper triangle of the (symmetric) distance matrix
+    "construction": "greedy",       # how the initial path of each vehicle is constructed, one of problem.utils.CONSTRUCTIONS
+    "initial_solution": "assignment",   # how the initial solution of the algorithm 1 is generated, one of INITIAL_SOLUTIONS in problem/SBRP.py
+    "clustering": "kmeans",         # how the stations are clustered into the groups of the algorithm 2, one of grouping.CLUSTERINGS
+    "assignment": "differencing",   # how the stations are assigned to the vehicles by the initial solution, one of problem.utils.ASSIGNMENTS
+    "engine": "annealing",          # one of SEARCH_ENGINES
+    "chains": 1,                    # number of independent chains of the simulated annealing, the best solution is returned
+    "processes": None,              # number of processes that run the chains (or replicas), None for one per core
+    "seed": None,                   # master seed of the random numbers (requests, grouping and chains), None for a random run
+    "time_limit": None,             # time (in seconds) after which solve() returns the best solution found so far, None for no limit
+    "iteration_limit": None,        # maximum number of steps of each chain (or replica) of the search, None for no limit
+    "incumbent_file": None,         # JSON Lines file to which the improving solutions are appended during the search (see incumbents)
+    "incumbent_interval": 1.0,      # minimum time (in seconds) between two incumbents written by the same search
+    "checkpoint_file": None,        # file to which the state of the search is saved periodically (a single chain of the algorithm 1 only)
+    "checkpoint_interval": 60,      # time (in seconds) between two checkpoints
+    "resume": False                 # resume the search from the checkpoint file if it exists (with the requests saved in it)
+}
+
+# the values of the options that take one of a fixed set of values, see default_options
+option_values = {
+    "requests_mode": REQUESTS_MODES,
+    "distance_mode": DISTANCE_MODES,
+    "distance_dtype": ("float64", "float32"),
+    "construction": CONSTRUCTIONS,
+    "initial_solution": INITIAL_SOLUTIONS,
+    "clustering": CLUSTERINGS,
+    "assignment": ASSIGNMENTS,
+    "engine": SEARCH_ENGINES
+}
+
+def solve(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm = "1", hyperparameters = "default", options = None):
+    # fill in the options that were not given with their default values
+    options = { **default_options, **(options if options is not None else {}) }
+
+    if options.get("engine") not in SEARCH_ENGINES:
+        raise ValueError("Unknown search engine: " + str(options.get("engine")) + " (available: " + ", ".join(SEARCH_ENGINES) + ")")
+
+    # the request cache is shared by all calls in the process (and persisted if a file is given)
+    request_cache = None
+    if options.get("request_cache") or options.get("request_cache_file") is not None:
+        request_cache = get_request_cache(options.get("request_cache_file"))
+
+    # the time limit is measured from here, i.e. it includes computing the requests, the distances and the initial solutions
+    solve_start_time = time.monotonic()
+
+    # the checkpoint the search is resumed from, it also holds the requests the search was started with
+    checkpoint = None
+    if options.get("checkpoint_file") is not None and options.get("resume"):
+        checkpoint = load_checkpoint(options.get("checkpoint_file"))
+
+        if checkpoint is not None and (checkpoint.get("algorithm") != algorithm or len(checkpoint.get("requests")) != len(coordinates) - 1):
+            raise ValueError("The checkpoint " + str(options.get("checkpoint_file")) + " was saved for another problem or algorithm")
+
     # compute the requests for all stations
     start_time = time.time()
-    requests = compute_requests(utilisation_data, vehicle_capacity)
+    if checkpoint is not None:
+        requests = checkpoint.get("requests")
+    else:
+        requests_rng = random.Random(options.get("seed")) if options.get("seed") is not None else random
+        requests = compute_requests(utilisation_data, vehicle_capacity, options.get("requests_mode"), request_cache, requests_rng)
     end_time = time.time()
     requests_time = end_time - start_time
 
+    if request_cache is not None:
+        request_cache.save()
+
     # print(sum(requests))   # <- for debugging only
 
     # check if the problem is solvable
@@ -121,14 +309,27 @@ def solve(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorith
     # choose the correct solution approach and set of hyperparameters
     solver = algorithms.get(algorithm).get("algorithm")
     if hyperparameters == "default":
-        hyperparameters = algorithms.get(algorithm).get("default_hyperparameters")
+        if options.get("engine") == "tempering":
+            hyperparameters = tempering_default_hyperparameters
+        else:
+            hyperparameters = algorithms.get(algorithm).get("default_hyperparameters")
     # # NOTE: if hyperparameters were given as an argument, they should be validated,
     # otherwise the SA code might break;
     # this is left for future development
 
+    # the solver searches until the deadline, so that solve() returns within the time limit
+    # NOTE: the search stops at its next step (or sweep) after the limit, with the initial solution if there was no time left
+    deadline = solve_start_time + options.get("time_limit") if options.get("time_limit") is not None else None
+
+    checkpointer = None
+    if options.get("checkpoint_file") is not None:
+        resume_state = checkpoint.get("search") if checkpoint is not None else None
+        checkpointer = Checkpointer(options.get("checkpoint_file"), options.get("checkpoint_interval"), resume_state, { "algorithm": algorithm, "requests": requests })
+
     # run the appropriate solution approach
+    search_stats = {}
     start_time = time.time()
-    solution = solver(coordinates, requests, vehicle_num, vehicle_capacity, hyperparameters)
+    solution = solver(coordinates, requests, vehicle_num, vehicle_capacity, hyperparameters, options, search_stats, checkpointer, deadline)
     end_time = time.time()
     solution_time = end_time - start_time
 
@@ -142,7 +343,11 @@ def solve(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorith
         "solution": list( zip(solution.get_initial_loads(), solution.vehicle_paths) ),
         "solution_time": solution_time,
         "cost": solution.cost,
-        "total_time": requests_time + solution_time
+        "total_time": requests_time + solution_time,
+        "search_stats": search_stats
     }
 
+    if request_cache is not None:
+        result["request_cache_stats"] = request_cache.stats
+
     return result
@@ -10,6 +10,11 @@ import solver
 
 import pandas as pd
 
+# the time (in seconds) after which the search returns the best solution it has found so far
+TIME_LIMIT = 300
+# the extra time after which the process is terminated, e.g. if the initial solution cannot be found
+TIME_LIMIT_GRACE = 60
+
 # #######################################################################
 # The function parses command line parameters. It expects to receive an array
 # where each item is a parameter. The 0-th item is the name of the program followed
@@ -31,6 +36,14 @@ def parse_args(argv):
         "stats_file": argv[3]
     }
 
+    # the distance matrix cache is optional, it is shared by all problems in the directory
+    if len(argv) >= 5:
+        args["distance_cache_dir"] = argv[4]
+
+    # so is the request cache file, which lets the problems (and runs) reuse the requests of identical stations
+    if len(argv) >= 6:
+        args["request_cache_file"] = argv[5]
+
     return args
 
 def process_result(result, id_mapping, solution_dir, problem_name, algo, timed_out):
@@ -61,10 +74,10 @@ def process_result(result, id_mapping, solution_dir, problem_name, algo, timed_o
 
     return [num_vehicles_used, cost, requests_time, solution_time, total_time, timed_out]
 
-def run_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, result):
-    result["result"] = solver.solve(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm)
+def run_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, options, result):
+    result["result"] = solver.solve(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, options = options)
 
-def test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, algorithm_name):
+def test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, algorithm_name, options):
     print("  " + algorithm_name + " - attempts: ", end="")
     # result = None
     manager = multiprocessing.Manager()
@@ -73,11 +86,11 @@ def test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_ca
     timed_out = False
     while num_attempts < 2 and result.get("result") is None:
         print(num_attempts + 1, end = " ")
-        p = multiprocessing.Process(target = run_algorithm, args = (coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, result))
+        p = multiprocessing.Process(target = run_algorithm, args = (coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm, options, result))
         p.start()
 
-        # wait for 5 minutes
-        p.join(300)
+        # wait for the search to use up its time limit
+        p.join(TIME_LIMIT + TIME_LIMIT_GRACE)
 
         # terminate the function if it is still running
         if p.is_alive():
@@ -85,6 +98,10 @@ def test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_ca
             p.join()
             timed_out = True
             print(" - timed out", end = " ")
+        elif result.get("result") is not None and result.get("result").get("search_stats").get("stop_reason") == "time_limit":
+            # the search was stopped by the time limit, but it returned the best solution it had found
+            timed_out = True
+            print(" - time limit reached", end = " ")
         # result = solver.solve(coordinates, utilisation_data, vehicle_num, vehicle_capacity, algorithm)
         num_attempts += 1
     print( ("[solution found]" if result.get("result") is not None else "[fail]") )
@@ -92,7 +109,7 @@ def test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_ca
     # return result, num_attempts, timed_out
     return result.get("result"), num_attempts, timed_out
 
-def test_single_problem(problem_dir, filename, solution_dir):
+def test_single_problem(problem_dir, filename, solution_dir, options):
     # load the problem specification
     problem_specs = utils.load_problem_specs(problem_dir + filename)
     if problem_specs is None:
@@ -108,10 +125,10 @@ def test_single_problem(problem_dir, filename, solution_dir):
     vehicle_capacity = problem_specs.get("vehicles").get("capacity")
 
     # test SA on SBRP
-    result_SBRP, SBRP_num_attempts, SBRP_timed_out = test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, "1", "SBRP")
+    result_SBRP, SBRP_num_attempts, SBRP_timed_out = test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, "1", "SBRP", options)
 
     # test SA on multiple OnePDTSPs
-    result_OnePDTSP, OnePDTSP_num_attempts, OnePDTSP_timed_out = test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, "2", "OnePDTSP")
+    result_OnePDTSP, OnePDTSP_num_attempts, OnePDTSP_timed_out = test_single_algorithm(coordinates, utilisation_data, vehicle_num, vehicle_capacity, "2", "OnePDTSP", options)
 
     # print("  OnePDTSP - attempts: ", end="")
     # result_OnePDTSP = None
@@ -145,9 +162,15 @@ def main():
 
     solution_dir = args.get("solution_dir") + "/" #"../test/solutions/"
 
+    options = {
+        "distance_cache_dir": args.get("distance_cache_dir"),
+        "request_cache_file": args.get("request_cache_file"),
+        "time_limit": TIME_LIMIT
+    }
+
     for filename in problem_files:
         print("Testing: " + filename)
-        problem_row = test_single_problem(problem_dir, filename, solution_dir)
+        problem_row = test_single_problem(problem_dir, filename, solution_dir, options)
         stats_df.loc[len(stats_df)] = problem_row
         print("--------------------------")
 
@@ -26,4 +26,7 @@ def perform_postprocessing(result, id_mapping):
     r["solution_time"] = result.get("solution_time")
     r["total_time"] = result.get("total_time")
 
+    if result.get("search_stats") is not None:
+        r["search_stats"] = result.get("search_stats")
+
     return r
@@ -1,12 +1,18 @@
-from solver import algorithms
+import json
+from solver import algorithms, default_options
 
 def get_help():
-    help_text = "Usage: python3.7 main.py  <problem_file>  [solution_method]  [solution_file]\n\n"
+    help_text = "Usage: python3.7 main.py  <problem_file>  [solution_method]  [solution_file]  [--option=value ...]\n\n"
     help_text += "Available solution methods:\n"
 
     for algorithm_code, algorithm in algorithms.items():
         help_text += "\t" + algorithm_code + " - " + algorithm.get("description", "No description provided or out-of-use. See the documentation for details") + "\n"
 
+    help_text += "\nAvailable options (with their default values), e.g. --chains=8 --seed=42:\n"
+
+    for option, default_value in default_options.items():
+        help_text += "\t--" + option + "=" + json.dumps(default_value) + "\n"
+
     return help_text
 
 def stringify_result(result):
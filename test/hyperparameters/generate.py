@@ -20,6 +20,20 @@ for a_val in alpha_values:
             }
             params_sets.append(hyperparameters)
 
+# the adaptive schedule, see algorithms.simulatedannealing.adaptive_schedule_defaults
+params_sets.append({
+    "initial_probability_threshold": init_prob,
+    "min_temp_percentage": 0.000001,
+    "schedule": "adaptive",
+    "phase_length_factor": 0.5,
+    "min_phase_length": 10,
+    "max_phase_length": 2000,
+    "min_alpha": 0.8,
+    "max_alpha": 0.99,
+    "stagnation_phases": 10,
+    "stagnation_acceptance": 0.1
+})
+
 counter = 1
 for params in params_sets:
     filename = "hyperparameters" + str(counter) + ".json"